@@ -1,20 +1,37 @@
+import asyncio
+import json
+import os
+import sys
+
 from abc import ABC, abstractmethod
-from collections.abc import Iterator
+from collections.abc import Collection, Iterator
+from contextlib import closing, contextmanager, nullcontext
 from dataclasses import dataclass
 from enum import IntEnum
 from functools import partial
-from typing import Any
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Coroutine, TextIO
 
+import glm
 import pygame
 import pygame._sdl2 as sdl2
 
 from pygame.typing import ColorLike, Point
 
+from ddframework.memory import MemoryTracker
 from ddframework.msgbroker import broker
-from ddframework.profiler import Profiler
+from ddframework.pacer import FramePacer
+from ddframework.profiler import Profiled, profiler
 from ddframework.statemachine import StateMachine, StateWalker
+from ddframework.telemetry import TelemetrySink
+
+__all__ = ['App', 'GameState', 'StackPermissions', 'StateExit', 'WAKEUP']
 
-__all__ = ['App', 'GameState', 'StackPermissions', 'StateExit']
+_NO_MEMORY_STAGE = nullcontext()
+
+# Posted by the broker, to end an idle wait when another thread sent a message
+WAKEUP = pygame.event.custom_type()
 
 
 def _size_to_window(scale, p):
@@ -37,6 +54,33 @@ def _coordinates_from_window(viewport, scale, p):
             p[1] / scale[1] - viewport.top)
 
 
+# The *_array variants convert many points in one go.  They take any
+# sequence of points and return a `glm.array` of `vec2`.  Passing a
+# `glm.array` avoids the conversion.
+def _as_array(points):
+    if isinstance(points, glm.array):
+        return points
+
+    points = [glm.vec2(p) for p in points]
+    return glm.array(points) if points else glm.array.zeros(0, glm.vec2)
+
+
+def _size_to_window_array(scale, points):
+    return _as_array(points) * scale
+
+
+def _size_from_window_array(scale, points):
+    return _as_array(points) / scale
+
+
+def _coordinates_to_window_array(offset, scale, points):
+    return (_as_array(points) + offset) * scale
+
+
+def _coordinates_from_window_array(offset, scale, points):
+    return _as_array(points) / scale - offset
+
+
 class StackPermissions(IntEnum):
     NONE = 0
     UPDATE = 1
@@ -47,10 +91,21 @@ class StackPermissions(IntEnum):
 
 
 class StateExit(Exception):
-    pass
+    # The state that raised, filled in by the App, so the transition applies
+    # to its stack entry and not to whatever is on top, e.g. an overlay.
+    state: 'GameState | None' = None
+
 
+class GameState(Profiled, ABC):
+    # update and draw of every state show up as a profiler scope named after
+    # the state class.
+    profiled_methods = ('update', 'draw')
+
+    # The event types `dispatch_event` wants to see.  None means all events.
+    # If all states on the stack declare their types, everything else is
+    # already blocked by SDL.
+    event_types: Collection[int] | None = None
 
-class GameState(ABC):
     def __init__(self, app: 'App') -> None:
         self.app: 'App' = app
 
@@ -60,6 +115,14 @@ class GameState(ABC):
     def restart(self, from_state: 'GameState', result: Any) -> None:
         pass
 
+    def needs_redraw(self) -> bool:
+        """Return False if the next frame would look exactly like the last.
+
+        If no state on the stack needs a redraw, the App doesn't render the
+        frame and sleeps until the next event or `idle_timeout` instead.
+        """
+        return True
+
     def dispatch_event(self, e: pygame.event.Event) -> None:
         if (e.type == pygame.QUIT
                 or e.type == pygame.KEYDOWN and e.key == pygame.K_ESCAPE):
@@ -89,13 +152,38 @@ class App:
                  renderer: sdl2.Renderer | None = None,
                  fps: int,
                  bgcolor: ColorLike,
-                 do_clear: bool = True) -> None:
+                 do_clear: bool = True,
+                 tick_rate: float | None = None,
+                 max_steps: int = 5,
+                 headless: bool = False,
+                 pacer: FramePacer | None = None,
+                 idle_timeout: float = 0.1,
+                 profile: bool = True) -> None:
         self.title = title
         self.fps = fps
         self.bgcolor = bgcolor
         self.do_clear = do_clear
 
-        if window is None:
+        # Fixed timestep mode: if a tick_rate is given, `update` is called
+        # with a constant dt of 1 / tick_rate, as often as needed to catch up
+        # with the real time passed, but at most `max_steps` times per frame.
+        # The remaining fraction of a tick is left in `self.alpha` for the
+        # states to interpolate their rendering.
+        self.tick_rate = tick_rate
+        self.dt_fixed = 1 / tick_rate if tick_rate else None
+        self.max_steps = max_steps
+        self.accumulator = 0.0
+        self.alpha = 1.0
+
+        # The dummy driver must be selected before SDL video is initialized.
+        # The environment is only changed for that moment, so it doesn't
+        # leak into later, unrelated windows.
+        if headless:
+            self._init_headless()
+
+        if window is None and headless:
+            window = pygame.Window(title=title, size=resolution if resolution is not None else (640, 480))
+        elif window is None:
             window = pygame.Window(
                 title=title,
                 fullscreen_desktop=True,
@@ -108,22 +196,25 @@ class App:
 
         self.window = window
 
-        if renderer is None:
-            self.renderer = sdl2.Renderer(window)
+        self.renderer = renderer if renderer is not None else sdl2.Renderer(window)
 
         # renderer.logical_size returns (0, 0) if unset
         self.renderer.logical_size = resolution if resolution is not None else window.size
 
-        self.window_rect = pygame.Rect((0, 0), window.size)
         self.logical_rect = pygame.Rect((0, 0), self.renderer.logical_size)
-        self.viewport = self.renderer.get_viewport()
-
-        self.coordinates_from_window = partial(_coordinates_from_window, self.viewport, self.renderer.scale)
-        self.coordinates_to_window = partial(_coordinates_to_window, self.viewport, self.renderer.scale)
-        self.size_to_window = partial(_size_to_window, self.renderer.scale)
-        self.size_from_window = partial(_size_from_window, self.renderer.scale)
+        self.update_transform()
 
+        # Without a pacer, the frame rate is limited by `Clock.tick`
         self.clock = pygame.time.Clock()
+        self.pacer = pacer
+
+        # Render on demand: if no state needs a redraw, `frame` sets `idle`,
+        # and `run` waits up to `idle_timeout` seconds for the next event.
+        # Events received while waiting are kept in `_pending`.
+        self.idle_timeout = idle_timeout
+        self.idle = False
+        self.redraw = True
+        self._pending = []
         self.dt_max = 3 / fps
         self.running = True
 
@@ -131,75 +222,497 @@ class App:
         self.current_ticks = pygame.time.get_ticks() / 1000.0
 
         self.broker = broker
-        self.profiler = Profiler()
+        self.broker.wakeup = self.wakeup
+        # Like the broker, the profiler is global, so that instrumented
+        # states, sprites and handlers all report into the same one.  The
+        # frame budget and `profile` are only applied while the App runs,
+        # see `_profiling`.
+        self.profiler = profiler
+        self.profile = profile
 
         self.state_stack = []
 
-    def run(self, walker: StateWalker, perftrace: bool = False, stats: bool = False) -> None:
+        # The part of the frame that is running: 'events', 'update', 'draw'
+        # or None.  Used to attribute samples, see ddframework.sampler.
+        self.stage = None
+
+        # Optional MemoryTracker, see `run`
+        self.memory = None
+
+        # Event types the App handles itself, independent of the states.
+        # QUIT is always let through, see `route`.
+        self.event_types = {pygame.QUIT, pygame.WINDOWSIZECHANGED, pygame.WINDOWEXPOSED, WAKEUP}
+
+        # StackPermissions -> states that receive events/updates/draws, and
+        # event type -> states subscribed to it.
+        # Rebuilt lazily after `push` and `transition` changed the stack.
+        self._plan = {}
+        self._routes = {}
+        self._filter_dirty = True
+
+        # Tasks started with `spawn`, see `run_async`
+        self.tasks = set()
+
+    @staticmethod
+    def _init_headless() -> None:
+        if pygame.display.get_init():
+            if pygame.display.get_driver() != 'dummy':
+                raise RuntimeError('headless=True, but SDL video is already initialized '
+                                   f'with the {pygame.display.get_driver()} driver')
+            return
+
+        old = os.environ.get('SDL_VIDEODRIVER')
+        os.environ['SDL_VIDEODRIVER'] = 'dummy'
+        try:
+            pygame.display.init()
+        finally:
+            if old is None:
+                del os.environ['SDL_VIDEODRIVER']
+            else:
+                os.environ['SDL_VIDEODRIVER'] = old
+
+    def run(self, walker: StateWalker,
+            perftrace: bool | TelemetrySink = False,
+            stats: bool = False,
+            trace: str | Path | TextIO | None = None,
+            memory: bool | MemoryTracker = False) -> None:
+        """Run the state machine until the state stack is empty.
+
+        `perftrace` records the events, update and draw timings of every
+        frame into a `TelemetrySink`.  `True` writes CSV to stdout, in bulk.
+
+        `trace` records every profiler scope of every frame and writes them
+        to the given file in Trace Event Format when the App terminates.
+
+        `memory` records memory deltas of update and draw, sprite and texture
+        counts with a `MemoryTracker`.  `True` creates one.  Its stats are
+        included in the `stats` output.
+
+        """
+        with closing(self._frames(walker, perftrace, stats, trace, memory)) as frames:
+            for timeout in frames:
+                if timeout:
+                    self.wait(timeout)
+
+    async def run_async(self, walker: StateWalker, **kwargs: Any) -> None:
+        """Run the state machine as an asyncio task.
+
+        Same as `run`, but the rest of the frame budget and idle times are
+        spent in the event loop, at least once per frame, instead of
+        sleeping.  GameStates can start coroutines for I/O bound work with
+        `spawn`, and wait for broker messages with `broker.wait_for`.
+
+            asyncio.run(app.run_async(walker))
+
+        Tasks that are still running when the App terminates are cancelled.
+
+        """
+        budget = 1 / self.fps
+        try:
+            with closing(self._frames(walker, **kwargs)) as frames:
+                while True:
+                    start = perf_counter()
+                    try:
+                        timeout = next(frames)
+                    except StopIteration:
+                        break
+
+                    if timeout:
+                        await self.wait_async(timeout)
+                    else:
+                        # `tick` sleeps off whatever the event loop leaves over
+                        await asyncio.sleep(max(0, budget - (perf_counter() - start)))
+        finally:
+            for task in self.tasks:
+                task.cancel()
+
+    def spawn(self, coro: Coroutine) -> asyncio.Task:
+        """Run `coro` as a task in the event loop of `run_async`."""
+        task = asyncio.get_running_loop().create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    def _frames(self, walker: StateWalker,
+                perftrace: bool | TelemetrySink = False,
+                stats: bool = False,
+                trace: str | Path | TextIO | None = None,
+                memory: bool | MemoryTracker = False) -> Iterator[float]:
+        """The main loop of `run`, yields the idle timeout after each frame."""
+        sink = TelemetrySink(sys.stdout) if perftrace is True else perftrace or None
+
+        if trace is not None:
+            self.profiler.start_trace()
+
+        self.memory = MemoryTracker() if memory is True else memory or None
+        if self.memory is not None:
+            self.memory.start()
+
+        self.push(walker, StackPermissions.NONE)
+
+        try:
+            with self._profiling(), self.profiler.profile('total'):
+                while self.state_stack:
+                    dt, draw = self.tick()
+                    with self.profiler.profile('frame'):
+                        self.frame(dt, draw)
+
+                    if sink is not None:
+                        sink.record(self.profiler)
+
+                    if self.memory is not None:
+                        self.memory.frame()
+
+                    yield self.idle_timeout if self.idle and len(self.broker) == 0 else 0
+        finally:
+            self.reset_event_filter()
+
+            if sink is not None:
+                sink.flush()
+
+            if self.memory is not None:
+                self.memory.stop()
+
+            if trace is not None:
+                self.profiler.write_trace(trace, self.profiler.stop_trace())
+
+        if stats:
+            for key, prof_data in self.profiler.items():
+                print(key, prof_data, flush=True)
+
+            if self.memory is not None:
+                for key, prof_data in self.memory.stats.items():
+                    print(key, prof_data, flush=True)
+
+    @contextmanager
+    def _profiling(self) -> Iterator[None]:
+        """Apply the frame budget and `profile` to the global profiler."""
+        profiler = self.profiler
+        saved = profiler.budget, profiler.enabled
+        profiler.budget = 1 / self.fps
+        profiler.enabled = self.profile
+        try:
+            yield
+        finally:
+            profiler.budget, profiler.enabled = saved
+
+    def tick(self) -> tuple[float, bool]:
+        """Wait for the next frame, return its dt and if it should be drawn."""
+        if self.pacer is None:
+            dt = self.clock.tick(self.fps) / 1000.0
+            self.current_fps = self.clock.get_fps()
+            draw = True
+        else:
+            dt = self.pacer.tick(self.fps)
+            self.current_fps = self.pacer.get_fps()
+            if self.profiler.enabled:
+                self.profiler.accumulate('pacing', self.pacer.miss)
+            draw = not self.pacer.skip_draw
+
+        if self.dt_fixed is None:
+            dt = min(dt, self.dt_max)
+        self.current_ticks = pygame.time.get_ticks() / 1000.0
+
+        return dt, draw
+
+    def update_transform(self) -> None:
+        """Rebind the window <-> logical coordinate conversions.
+
+        Called automatically when the window size changes.
+
+        """
+        self.window_rect = pygame.Rect((0, 0), self.window.size)
+        self.viewport = self.renderer.get_viewport()
+
+        scale = self.renderer.scale
+        offset = glm.vec2(self.viewport.topleft)
+        scale_v = glm.vec2(scale)
+
+        self.coordinates_from_window = partial(_coordinates_from_window, self.viewport, scale)
+        self.coordinates_to_window = partial(_coordinates_to_window, self.viewport, scale)
+        self.size_to_window = partial(_size_to_window, scale)
+        self.size_from_window = partial(_size_from_window, scale)
+
+        self.coordinates_from_window_array = partial(_coordinates_from_window_array, offset, scale_v)
+        self.coordinates_to_window_array = partial(_coordinates_to_window_array, offset, scale_v)
+        self.size_to_window_array = partial(_size_to_window_array, scale_v)
+        self.size_from_window_array = partial(_size_from_window_array, scale_v)
+
+    def benchmark(self, walker: StateWalker, frames: int,
+                  dt: float | None = None,
+                  report: str | Path | TextIO | None = None) -> dict[str, Any]:
+        """Run `frames` frames as fast as possible with a constant `dt`.
+
+        There is no frame rate cap, so combined with `headless=True` (SDL
+        dummy driver, no vsync), this measures the raw cost of a state graph,
+        e.g. in CI.  If `dt` is not given, `1 / fps` is used.
+
+        The state stack is restored afterwards, so benchmarks can be repeated.
+
+        The profiler is reset before measuring, and its stats are returned as
+        a dict and, if `report` is given, written to it as JSON.  `report` can
+        be a file name or an open text file.
+
+        """
+        if dt is None:
+            dt = 1 / self.fps
+
+        self.profiler.reset()
+
+        depth = len(self.state_stack)
         self.push(walker, StackPermissions.NONE)
 
-        with self.profiler.profile('total'):
-            while self.state_stack:
-                dt = min(self.clock.tick(self.fps) / 1000.0, self.dt_max)
-                self.current_fps = self.clock.get_fps()
-                self.current_ticks = pygame.time.get_ticks() / 1000.0
+        frame = 0
+        try:
+            with self._profiling(), self.profiler.profile('total'):
+                while len(self.state_stack) > depth and frame < frames:
+                    self.current_fps = self.fps
+                    self.current_ticks = pygame.time.get_ticks() / 1000.0
+
+                    with self.profiler.profile('frame'):
+                        self.frame(dt)
+                    frame += 1
+        finally:
+            if len(self.state_stack) != depth:
+                del self.state_stack[depth:]
+                self._stack_changed()
+
+            self.reset_event_filter()
+
+        result = {
+            'frames': frame,
+            'dt': dt,
+            'stats': self.profiler.report(),
+        }
 
+        if isinstance(report, (str, Path)):
+            with open(report, 'w') as f:
+                json.dump(result, f, indent=4)
+        elif report is not None:
+            json.dump(result, report, indent=4)
+
+        return result
+
+    def frame(self, dt: float, draw: bool = True) -> None:
+        """Run a single frame: clear, events, update, draw, present.
+
+        With `draw` set to False, only events and update are processed, e.g.
+        to catch up when the loop fell behind.
+
+        """
+        rendered = False
+        self.idle = False
+
+        try:
+            self.stage = 'events'
+            with self.profiler.profile('events'): self.dispatch_events()
+            self.stage = 'update'
+            with self.profiler.profile('update'), self.memory_stage('update'):
+                if self.dt_fixed is None:
+                    self.update(dt)
+                else:
+                    self.fixed_update(dt)
+
+            if draw and not self.needs_redraw():
+                self.idle = True
+            elif draw:
+                self.stage = 'draw'
                 # This must happen here and not in the states due state stacking
                 with self.profiler.profile('cls'):
                     if self.do_clear:
                         self.renderer.draw_color = self.bgcolor
                         self.renderer.clear()
 
-                try:
-                    with self.profiler.profile('events'): self.dispatch_events()
-                    with self.profiler.profile('update'): self.update(dt)
-                    with self.profiler.profile('draw'):   self.draw()
-                except StateExit as e:
-                    self.transition(e.args if len(e.args) else None)
+                with self.profiler.profile('draw'), self.memory_stage('draw'):
+                    self.draw()
+                self.redraw = False
+                rendered = True
+        except StateExit as e:
+            self.transition(e.args if len(e.args) else None, self._position(e.state))
+        finally:
+            self.stage = None
 
-                self.renderer.present()
+        if rendered:
+            self.renderer.present()
 
-                if perftrace:
-                    print('events', self.profiler['events'])
-                    print('update', self.profiler['update'])
-                    print('draw', self.profiler['draw'], flush=True)
+    def memory_stage(self, name: str) -> Any:
+        """Measure the memory delta of a stage, if a MemoryTracker is set."""
+        return self.memory.stage(name) if self.memory is not None else _NO_MEMORY_STAGE
 
-        if stats:
-            for _, prof_data in self.profiler.items():
-                print(prof_data, flush=True)
+    def needs_redraw(self) -> bool:
+        """Check if the App or any drawing state needs a redraw."""
+        if self.redraw:
+            return True
+
+        return any(state.needs_redraw() for state in self.plan(StackPermissions.DRAW))
+
+    def wait(self, timeout: float) -> None:
+        """Sleep until an event arrives, but at most `timeout` seconds."""
+        e = pygame.event.wait(int(timeout * 1000))
+        if e.type != pygame.NOEVENT:
+            self._pending.append(e)
+
+        if self.pacer is not None:
+            self.pacer.resync()
+
+    async def wait_async(self, timeout: float) -> None:
+        """Like `wait`, but give the event loop control while waiting.
+
+        SDL events can't be awaited, so the queue is polled once per frame.
+
+        """
+        deadline = perf_counter() + timeout
+        while (perf_counter() < deadline
+               and not pygame.event.peek()
+               and len(self.broker) == 0):
+            await asyncio.sleep(min(1 / self.fps, timeout))
+
+        if self.pacer is not None:
+            self.pacer.resync()
+
+    def wakeup(self) -> None:
+        """End a running `wait`.  Can be called from any thread."""
+        pygame.event.post(pygame.event.Event(WAKEUP))
 
     def dispatch_events(self) -> None:
         self.mouse = self.coordinates_from_window(pygame.mouse.get_pos())
         self.keys = pygame.key.get_pressed()
 
-        for e in pygame.event.get():
-            states = (entry.state
-                      for i, entry in enumerate(self.state_stack[:-1])
-                      if self.state_stack[i + 1].passthrough & StackPermissions.EVENTS)
-            for state in states:
-                state.dispatch_event(e)
-
-            self.state_stack[-1].state.dispatch_event(e)
+        if self._filter_dirty:
+            self.update_event_filter()
+
+        events = pygame.event.get()
+        if self._pending:
+            events = self._pending + events
+            self._pending = []
+
+        for e in events:
+            if e.type == pygame.WINDOWSIZECHANGED:
+                self.update_transform()
+                self.redraw = True
+            elif e.type == pygame.WINDOWEXPOSED:
+                self.redraw = True
+            elif e.type == WAKEUP:
+                continue
+
+            # Fetched per event, since a handler might push a new state
+            try:
+                for state in self.route(e.type):
+                    state.dispatch_event(e)
+            except StateExit as exc:
+                if exc.state is None:
+                    exc.state = state
+                raise
 
         self.broker.tick()
 
     def update(self, dt: float = 0) -> None:
-        states = (entry.state
-                  for i, entry in enumerate(self.state_stack[:-1])
-                  if self.state_stack[i + 1].passthrough & StackPermissions.UPDATE)
-        for state in states:
-            state.update(dt)
+        try:
+            for state in self.plan(StackPermissions.UPDATE):
+                state.update(dt)
+        except StateExit as e:
+            if e.state is None:
+                e.state = state
+            raise
+
+    def fixed_update(self, dt: float) -> None:
+        """Run `update` with a fixed dt as often as `dt` allows.
+
+        The time not yet consumed carries over to the next frame, capped to
+        `max_steps` ticks, so a slow frame doesn't cause an ever growing
+        backlog.  After the steps, `self.alpha` contains the fraction of a
+        tick that is left over, to be used for interpolation in `draw`.
 
-        self.state_stack[-1].state.update(dt)
+        """
+        # The accumulator counts in ticks, not seconds, to keep the float
+        # arithmetic exact for whole ticks.
+        self.accumulator = min(self.accumulator + dt * self.tick_rate, self.max_steps)
+
+        while self.accumulator >= 1:
+            self.accumulator -= 1
+            self.update(self.dt_fixed)
+
+        self.alpha = self.accumulator
 
     def draw(self) -> None:
-        states = (entry.state
-                  for i, entry in enumerate(self.state_stack[:-1])
-                  if self.state_stack[i + 1].passthrough & StackPermissions.DRAW)
-        for state in states:
-            state.draw()
+        try:
+            for state in self.plan(StackPermissions.DRAW):
+                state.draw()
+        except StateExit as e:
+            if e.state is None:
+                e.state = state
+            raise
+
+    def plan(self, permission: StackPermissions) -> tuple[GameState, ...]:
+        """Return the states that get `permission`, bottom to top.
+
+        A stacked state is included if the state directly above it passes
+        `permission` through.  The topmost state is always included.
+
+        """
+        try:
+            return self._plan[permission]
+        except KeyError:
+            pass
+
+        stack = self.state_stack
+        states = tuple(entry.state
+                       for entry, above in zip(stack, stack[1:])
+                       if above.passthrough & permission)
+        states += (stack[-1].state, )
+
+        self._plan[permission] = states
+        return states
+
+    def route(self, event_type: int) -> tuple[GameState, ...]:
+        """Return the states that receive events of `event_type`.
+
+        If no state subscribed to QUIT, it goes to the top state anyway, so
+        the window can always be closed.
+
+        """
+        try:
+            return self._routes[event_type]
+        except KeyError:
+            pass
 
-        self.state_stack[-1].state.draw()
+        states = tuple(state for state in self.plan(StackPermissions.EVENTS)
+                       if state.event_types is None or event_type in state.event_types)
+
+        if not states and event_type == pygame.QUIT and self.state_stack:
+            states = (self.state_stack[-1].state, )
+
+        self._routes[event_type] = states
+        return states
+
+    def update_event_filter(self) -> None:
+        """Let SDL only queue the events the current states subscribed to."""
+        self._filter_dirty = False
+        if not self.state_stack:
+            pygame.event.set_allowed(None)
+            return
+
+        event_types = set(self.event_types)
+        for state in self.plan(StackPermissions.EVENTS):
+            if state.event_types is None:
+                pygame.event.set_allowed(None)
+                return
+
+            event_types.update(state.event_types)
+
+        pygame.event.set_blocked(None)
+        pygame.event.set_allowed(list(event_types))
+
+    def reset_event_filter(self) -> None:
+        """Let SDL queue all events again, e.g. after the App terminated."""
+        pygame.event.set_allowed(None)
+        self._filter_dirty = True
+
+    def _stack_changed(self) -> None:
+        self._plan.clear()
+        self._routes.clear()
+        self._filter_dirty = True
+        self.redraw = True
 
     def push(self,
              state_or_walker: GameState | Iterator,
@@ -214,12 +727,21 @@ class App:
 
         stackentry = StackEntry(next(walker), passthrough, walker)
         self.state_stack.append(stackentry)
+        self._stack_changed()
         self.state_stack[-1].state.reset(None)
 
     def is_stacked(self, state: GameState) -> None:
         return state in [_.state for _ in self.state_stack[:-1]]
 
-    def transition(self, result: tuple[Any] | int | None) -> None:
+    def _position(self, state: GameState | None) -> int:
+        """Return the stack position of `state`, -1 (the top) if unknown."""
+        for position, entry in enumerate(self.state_stack):
+            if entry.state is state:
+                return position
+
+        return -1
+
+    def transition(self, result: tuple[Any] | int | None, position: int = -1) -> None:
         # If the GameState raises StateExit(nn < 0):
         #   Pop
         #   If stack is empty, return
@@ -235,21 +757,29 @@ class App:
         #    else transition to tuple[0]
         # If Transition destination is None: Terminate
         # If stack is empty: return
+        #
+        # `position` is the stack entry to transition, by default the top.
+        # If it is popped, the entries stacked above it, e.g. an overlay,
+        # are popped with it.
 
         if isinstance(result, tuple):
             index = result[0]
         else:
             index = result
 
+        entry = self.state_stack[position]
         try:
-            followup = self.state_stack[-1].walker.send(index)
+            followup = entry.walker.send(index)
         except StopIteration:
-            from_state = self.state_stack.pop(-1).state
+            from_state = entry.state
+            del self.state_stack[position:]
+            self._stack_changed()
             if not self.state_stack:
                 return
 
             self.state_stack[-1].state.restart(from_state, result)
             return
 
-        self.state_stack[-1].state = followup
-        self.state_stack[-1].state.reset(result)
+        entry.state = followup
+        self._stack_changed()
+        followup.reset(result)
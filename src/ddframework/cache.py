@@ -1,16 +1,65 @@
-from collections import UserDict
+import copy
 
+from collections import OrderedDict, UserDict
+from collections.abc import Callable, Hashable
+from functools import partial
 
-__all__ = ['cache', 'Cache', 'add', 'get', 'get_all']
+import pygame
+import pygame._sdl2 as sdl2
+
+from ddframework.utils import compile_path
+
+
+__all__ = ['cache', 'Cache', 'TextureCache', 'add', 'get', 'get_all', 'sizeof']
 
 _cache = {}
 
 
 class Cache(UserDict):
+    # Lookups through this node may be memoized, see `xpath`
+    memoize = True
+
+    def __init__(self, *args, **kwargs):
+        # Memo entries resolved through this node, dropped on every write to
+        # it, see `xpath`.  Maps (id(memo), path) to the memo holding it.
+        self._dependents = {}
+        self._memo = {}
+        self._memo_early = {}
+        super().__init__(*args, **kwargs)
+
+    def __copy__(self):
+        # The memo belongs to this node, the copy starts with an empty one
+        c = self.__class__.__new__(self.__class__)
+        c.__dict__.update(self.__dict__)
+        c.data = self.data.copy()
+        c._dependents = {}
+        c._memo = {}
+        c._memo_early = {}
+        return c
+
+    def copy(self):
+        return copy.copy(self)
+
     def __missing__(self, key):
+        self._invalidate()
         self.data[key] = self.__class__()
         return self.data[key]
 
+    def __setitem__(self, key, item):
+        self._invalidate()
+        self.data[key] = item
+
+    def __delitem__(self, key):
+        self._invalidate()
+        del self.data[key]
+
+    def _invalidate(self):
+        """Drop the memo entries that were resolved through this node."""
+        if self._dependents:
+            for (_, path), memo in self._dependents.items():
+                memo.pop(path, None)
+            self._dependents.clear()
+
     # ?!? WHY ?!?
     #
     # def __setitem__(self, key, item):
@@ -34,21 +83,226 @@ class Cache(UserDict):
     def xpath(self, path: str, early=False) -> object:
         """Return the value in dict_ described by path (separated by `.`)
 
+        Resolved values are memoized, and the `Cache` nodes along the path
+        remember the entry.  A write to one of these nodes drops it at once,
+        so the memo never holds on to replaced or deleted values, writes
+        elsewhere don't touch it.  Writes into plain dicts stored in the
+        cache are not noticed, and lookups through nodes with
+        `memoize = False` (e.g. `TextureCache`) are never memoized.
+
+        A memo hit is a single dict lookup, several times faster than walking
+        the `Cache` nodes, whose `__getitem__` is Python code.
+
         :param path: Inspired by xpath, the path into the dictionary
         :param early: If the path can't be followed up to the end, still return what already matched
         :return: The cached object
 
         """
 
+        memo = self._memo_early if early else self._memo
+        try:
+            return memo[path]
+        except KeyError:
+            pass
+
         res = self.data
-        for k in path.split('.'):
+        visited = [self]
+        memoize = self.memoize
+        for k in compile_path(path):
+            if isinstance(res, Cache):
+                visited.append(res)
+                memoize = memoize and res.memoize
+
             try:
                 res = res[k]
             except TypeError, KeyError:
-                if early: return res
+                if early: break
                 raise
 
+        # Registered after the walk, which may have created nodes
+        if memoize:
+            memo[path] = res
+            dependent = (id(memo), path)
+            for node in visited:
+                node._dependents[dependent] = memo
+
         return res
 
+    def accessor(self, path: str, early=False) -> Callable[[], object]:
+        """Return a function doing `self.xpath(path, early)`."""
+
+        return partial(self.xpath, path, early)
+
+    def set_xpath(self, path: str, item: object) -> None:
+        """Store item at the position described by path (separated by `.`)
+
+        Missing intermediate nodes are created as nested caches.
+
+        :param path: The path into the cache, see `xpath`
+        :param item: The object to store
+
+        """
+
+        *nodes, key = compile_path(path)
+
+        res = self
+        for k in nodes:
+            res = res[k]
+
+        res[key] = item
+
+
+def sizeof(item: object, bpp: int = 4) -> int:
+    """Estimate the memory of a texture or surface in bytes, 0 for others.
+
+    :param item: The cached object
+    :param bpp: Bytes per pixel of textures, SDL doesn't tell
+
+    """
+    if isinstance(item, sdl2.Texture):
+        return item.width * item.height * bpp
+    elif isinstance(item, pygame.Surface):
+        return item.get_width() * item.get_height() * item.get_bytesize()
+
+    return 0
+
+
+class TextureCache(Cache):
+    """A flat cache tier with a byte budget.
+
+    Textures and surfaces are accounted with their estimated size, see
+    `sizeof`.  When the total exceeds `budget`, the least recently used
+    entries are evicted, except the pinned ones.  If `reload` is given, a
+    missing key is loaded with `reload(key)` on access, so evicted entries
+    come back transparently, also through `get`, and `in` is true for them.
+
+    An entry larger than the whole budget is refused with a ValueError, it
+    would only evict everything else and then itself.
+
+    Mount it into the cache tree to use it with `xpath` and `set_xpath`:
+
+        cache['textures'] = TextureCache(64 * 2**20, reload=load_texture)
+        ship = cache.xpath('textures.ship')
+
+    """
+
+    # Every access updates the LRU order, so it must not be memoized
+    memoize = False
+
+    def __init__(self, budget: int,
+                 reload: Callable[[Hashable], object] | None = None,
+                 bpp: int = 4) -> None:
+        """Create a texture cache.
+
+        :param budget: Maximum bytes to keep, pinned entries can exceed it
+        :param reload: Called with the key on a miss, returns the item
+        :param bpp: Bytes per pixel of textures
+
+        """
+        super().__init__()
+        self.data = OrderedDict()
+
+        self.budget = budget
+        self.reload = reload
+        self.bpp = bpp
+
+        self.sizes = {}
+        self.pinned = set()
+        self.evicted = set()
+        self.bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.reloads = 0
+
+    def __copy__(self):
+        c = super().__copy__()
+        c.sizes = self.sizes.copy()
+        c.pinned = self.pinned.copy()
+        c.evicted = self.evicted.copy()
+        return c
+
+    def __getitem__(self, key):
+        try:
+            item = self.data[key]
+        except KeyError:
+            self.misses += 1
+            if self.reload is None:
+                raise
+
+            item = self.reload(key)
+            self.reloads += 1
+            self[key] = item
+            return item
+
+        self.hits += 1
+        self.data.move_to_end(key)
+        return item
+
+    def __contains__(self, key):
+        """Resident, or evicted and reloadable"""
+        return key in self.data or (self.reload is not None and key in self.evicted)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, item):
+        size = sizeof(item, self.bpp)
+        if size > self.budget:
+            raise ValueError(f'{key} needs {size} bytes, more than the budget of {self.budget}')
+
+        if key in self.data:
+            self.bytes -= self.sizes[key]
+
+        self.evicted.discard(key)
+        self.data[key] = item
+        self.data.move_to_end(key)
+        self.sizes[key] = size
+        self.bytes += size
+
+        self.evict()
+
+    def __delitem__(self, key):
+        del self.data[key]
+        self.bytes -= self.sizes.pop(key)
+        self.pinned.discard(key)
+
+    def pin(self, *keys: Hashable) -> None:
+        """Never evict these keys."""
+        self.pinned.update(keys)
+
+    def unpin(self, *keys: Hashable) -> None:
+        self.pinned.difference_update(keys)
+        self.evict()
+
+    def evict(self) -> None:
+        """Evict least recently used entries until the budget is met."""
+        if self.bytes <= self.budget:
+            return
+
+        for key in [k for k in self.data if k not in self.pinned]:
+            del self[key]
+            self.evicted.add(key)
+            self.evictions += 1
+            if self.bytes <= self.budget:
+                break
+
+    def report(self) -> dict[str, int]:
+        """Return the residency and eviction counters."""
+        return {
+            'entries': len(self.data),
+            'pinned': len(self.pinned),
+            'bytes': self.bytes,
+            'budget': self.budget,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'reloads': self.reloads,
+        }
+
 
 cache = Cache()
@@ -0,0 +1,185 @@
+"""A GameState that preloads assets in the background.
+
+The manifest maps cache paths (see `Cache.xpath`) to assets.  Files are
+loaded and decoded on a thread pool, while the texture uploads, which must
+happen on the main thread, are done in `update` within a time budget per
+frame, so the progress bar keeps moving.
+
+    manifest = {
+        'images.ship': image('assets/ship.png'),
+        'fonts.title': font('assets/title.ttf', 48),
+        'textures.particle': surface(make_particle, 16, 'white'),
+    }
+
+    sm.add(Loader(app, manifest), title)
+
+Once everything is in the cache, the loader leaves with `StateExit(followup)`.
+"""
+
+import queue
+
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from time import perf_counter
+from typing import Any, NamedTuple
+
+import pygame
+import pygame._sdl2 as sdl2
+
+from pygame.typing import ColorLike
+
+import ddframework.cache
+
+from ddframework.app import App, GameState, StateExit
+
+__all__ = ['Asset', 'Loader', 'font', 'image', 'surface']
+
+
+class Asset(NamedTuple):
+    """Something to load.
+
+    `load` is called on a worker thread.  If `texture` is set, the resulting
+    surface is turned into a `Texture` on the main thread.
+    """
+    load: Callable[[], Any]
+    texture: bool = False
+
+
+def image(path: str, texture: bool = True) -> Asset:
+    """An image file, by default uploaded as texture"""
+    return Asset(partial(pygame.image.load, path), texture)
+
+
+def font(path: str | None, size: int) -> Asset:
+    """A font file, `None` for the default font"""
+    return Asset(partial(pygame.font.Font, path, size))
+
+
+def surface(fn: Callable[..., pygame.Surface], *args: Any,
+            texture: bool = True, **kwargs: Any) -> Asset:
+    """A surface built by `fn(*args, **kwargs)`, by default uploaded as texture"""
+    return Asset(partial(fn, *args, **kwargs), texture)
+
+
+class Loader(GameState):
+    def __init__(self, app: App, manifest: dict[str, Asset],
+                 *,
+                 followup: int | None = 0,
+                 workers: int | None = None,
+                 budget: float = 0.005,
+                 cache: ddframework.cache.Cache | None = None,
+                 color: ColorLike = 'white') -> None:
+        """Create a loading state.
+
+        :param manifest: Maps cache paths to assets
+        :param followup: Passed to `StateExit` when loading is done
+        :param workers: Size of the thread pool, see `ThreadPoolExecutor`
+        :param budget: Seconds per frame to spend on texture uploads
+        :param cache: The cache to fill, defaults to `ddframework.cache.cache`
+        :param color: Color of the progress bar
+
+        """
+        super().__init__(app)
+
+        self.manifest = manifest
+        self.followup = followup
+        self.workers = workers
+        self.budget = budget
+        self.cache = cache if cache is not None else ddframework.cache.cache
+        self.color = color
+
+        self.done = 0
+        self.drawn = None
+        self._executor = None
+        self._results = queue.SimpleQueue()
+
+    @property
+    def total(self) -> int:
+        return len(self.manifest)
+
+    @property
+    def progress(self) -> float:
+        """Fraction of the manifest that is in the cache, 0.0 - 1.0"""
+        return self.done / self.total if self.total else 1.0
+
+    def reset(self, *args: Any, **kwargs: Any) -> None:
+        self.done = 0
+        self.drawn = None
+
+        # Entered again, e.g. after an error: drop the previous run
+        self.shutdown()
+        self._results = queue.SimpleQueue()
+
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='Loader')
+        for path, asset in self.manifest.items():
+            future = self._executor.submit(asset.load)
+            future.add_done_callback(partial(self._finished, self._results, path, asset))
+
+    def shutdown(self) -> None:
+        """Stop the workers, pending loads are cancelled."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    @staticmethod
+    def _finished(results: queue.SimpleQueue, path: str, asset: Asset, future) -> None:
+        # Called on the worker thread, only hand over to the main thread
+        results.put((path, asset, future))
+
+    def update(self, dt: float) -> None:
+        renderer = self.app.renderer
+        deadline = perf_counter() + self.budget
+
+        # At least one result per frame, so even a tiny budget makes progress
+        while True:
+            try:
+                path, asset, future = self._results.get_nowait()
+            except queue.Empty:
+                break
+
+            # Re-raises exceptions from the worker
+            try:
+                item = future.result()
+            except BaseException:
+                self.shutdown()
+                raise
+
+            if asset.texture:
+                item = sdl2.Texture.from_surface(renderer, item)
+
+            self.cache.set_xpath(path, item)
+            self.done += 1
+
+            if perf_counter() >= deadline:
+                break
+
+        if self.done == self.total:
+            self.shutdown()
+            raise StateExit(self.followup)
+
+    def dispatch_event(self, e: pygame.event.Event) -> None:
+        # Leaving early, e.g. on ESC, must not keep the workers running
+        try:
+            super().dispatch_event(e)
+        except StateExit:
+            self.shutdown()
+            raise
+
+    def needs_redraw(self) -> bool:
+        return self.progress != self.drawn
+
+    def draw(self) -> None:
+        renderer = self.app.renderer
+        screen = self.app.logical_rect
+
+        bar = pygame.Rect(0, 0, screen.width // 2, screen.height // 32)
+        bar.center = screen.center
+        fill = bar.copy()
+        fill.width = int(bar.width * self.progress)
+
+        renderer.draw_color = self.color
+        renderer.draw_rect(bar)
+        renderer.fill_rect(fill)
+
+        self.drawn = self.progress
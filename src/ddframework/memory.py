@@ -0,0 +1,112 @@
+"""Per-frame memory and object accounting.
+
+Leaks like a texture per particle or per text change are invisible until
+the game slows down.  The MemoryTracker records
+
+    * the tracemalloc delta of the 'update' and 'draw' stages,
+    * the number of sprites in watched groups,
+    * the number of live `sdl2.Texture` objects and their estimated size
+
+into its own `Profiler`, so the usual stats (avg, min, max) apply.  The
+deltas can be negative and none of these are times, so the profiler keeps
+no histograms and the percentiles are NaN.  Pass it to `App.run`:
+
+    tracker = MemoryTracker()
+    tracker.watch('particles', emitter)
+    app.run(walker, memory=tracker, stats=True)
+
+tracemalloc slows down the whole program noticeably, so this is opt-in.
+Live textures are found by scanning the garbage collector's objects, which
+is only done every `texture_interval` frames.
+"""
+
+import gc
+import tracemalloc
+
+from collections.abc import Sized
+
+import pygame._sdl2 as sdl2
+
+from ddframework.profiler import Profiler
+
+__all__ = ['MemoryTracker']
+
+# Textures are assumed to be 32 bit
+TEXTURE_BPP = 4
+
+
+class MemoryStage:
+    """Context manager recording the traced memory delta of a block."""
+
+    __slots__ = ('tracker', 'stat', 'start')
+
+    def __init__(self, tracker: 'MemoryTracker', stat: str) -> None:
+        self.tracker = tracker
+        self.stat = stat
+
+    def __enter__(self) -> None:
+        self.start = tracemalloc.get_traced_memory()[0]
+
+    def __exit__(self, *exc: object) -> None:
+        delta = tracemalloc.get_traced_memory()[0] - self.start
+        self.tracker.stats.accumulate(self.stat, delta)
+
+
+class MemoryTracker:
+    def __init__(self, texture_interval: int = 60) -> None:
+        """Create a memory tracker.
+
+        :param texture_interval: Scan for live textures every n frames
+
+        """
+        self.texture_interval = texture_interval
+        self.stats = Profiler(histogram=None)
+        self.groups = {}
+        self.frames = 0
+
+        self._started_tracemalloc = False
+
+    def start(self) -> None:
+        """Start tracemalloc, unless it is already running."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+
+    def stop(self) -> None:
+        """Stop tracemalloc, if it was started by `start`."""
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def watch(self, name: str, group: Sized) -> None:
+        """Record the length of `group`, e.g. a sprite group, every frame."""
+        self.groups[name] = group
+
+    def unwatch(self, name: str) -> None:
+        del self.groups[name]
+
+    def stage(self, name: str) -> MemoryStage:
+        """Return a context manager recording the memory delta as `mem.<name>`."""
+        return MemoryStage(self, f'mem.{name}')
+
+    def frame(self) -> None:
+        """Record the per-frame counts, call once per frame."""
+        for name, group in self.groups.items():
+            self.stats.accumulate(f'sprites.{name}', len(group))
+
+        if self.frames % self.texture_interval == 0:
+            self.scan_textures()
+
+        self.frames += 1
+
+    def scan_textures(self) -> None:
+        """Count the live textures and estimate their size."""
+        count = 0
+        size = 0
+        for o in gc.get_objects():
+            if type(o) is sdl2.Texture:
+                count += 1
+                size += o.width * o.height * TEXTURE_BPP
+
+        self.stats.accumulate('textures', count)
+        self.stats.accumulate('texture_bytes', size)
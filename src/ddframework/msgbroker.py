@@ -1,8 +1,78 @@
+"""A simple message broker.
+
+Messages are queued by `send` and dispatched to the registered receivers
+once per frame by `tick`, which `App` calls after the event dispatch.
+
+The queue is double buffered: `tick` swaps the list of pending messages for
+an empty one before dispatching, so messages sent by receivers during the
+tick are deferred to the next frame instead of extending the current one.
+A message cascade costs one frame per step, but never stalls a frame.
+
+Additionally, the work per tick can be limited with `time_budget` and
+`max_messages`.  Messages left over are carried over to the next tick ahead
+of the new ones.  `dispatched` and `carried` tell how much was done and how
+much was left in the last tick.
+
+Per message type, a policy can be set on `register` or with `set_policy`:
+
+    * `priority`: Messages of a higher priority are dispatched first, and
+      so are the last to be carried over if the budget runs out.
+    * `coalesce`: For high frequency messages where only the latest value
+      matters.  A new message replaces a pending one of the same type (and
+      `key`), keeping its place in the queue.  Instead of `True`, a merge
+      function `merge(old, new) -> Message` can be passed, e.g. to sum up
+      deltas.
+
+    broker.register(hud.on_score, 'score', coalesce=True)
+    broker.register(hud.on_damage, 'damage', priority=Priority.HIGH,
+                    coalesce=lambda old, new: Message(new.message, (old.args[0] + new.args[0], ), {}))
+
+`register` returns a `Subscription`, which unregisters the callback again.
+With `weak=True`, the broker only keeps a weak reference to the callback, so
+e.g. the bound methods of a GameState don't keep it alive, and it's
+unregistered automatically when it dies.  Receivers are called in the order
+they were registered.
+
+`send` is meant for the main thread.  Other threads use `post`, which goes
+through a thread-safe inbox that is drained at the start of `tick`, and calls
+`wakeup`, so an idle App notices the message without waiting for its
+timeout.  `post_when_done` turns the completion of a
+`concurrent.futures.Future` into a message:
+
+    broker.post_when_done(executor.submit(load_level, 3), 'level_loaded')
+
+Within `App.run_async`, the next message of a type can be awaited:
+
+    msg = await broker.wait_for('level_loaded')
+
+`instrument` makes the broker report into a `Profiler`, per message type:
+
+    * `broker.<type>.sent` and `broker.<type>.dispatched`: messages per tick,
+      for the ticks that had any
+    * `broker.<type>.latency`: seconds from `send` to dispatch
+    * `broker.<type>.<receiver>#<id>`: seconds spent in each receiver, the
+      id of the subscription keeps e.g. the same method of two GameStates
+      apart
+
+Receivers slower than `slow_handler` are counted in `slow_handlers`.
+"""
+
+import asyncio
+import inspect
 import queue
+import weakref
 
-from collections import defaultdict
+from collections import Counter, defaultdict
+from itertools import count
+from concurrent.futures import Future
+from enum import IntEnum
+from functools import partial
+from time import perf_counter
 from typing import Any, Callable, Hashable, NamedTuple
 
+from ddframework.profiler import COUNT_RANGE, Profiler
+
+__all__ = ['Message', 'MessageBroker', 'Policy', 'Priority', 'Subscription', 'UnknownMessageType', 'broker']
 
 MessageType = Hashable
 MessageReceiver = Callable[Any, None]
@@ -20,45 +90,415 @@ class Message(NamedTuple):
         return f'{self.message}: {self.args}, {self.kwargs}'
 
 
+class _TimedMessage(Message):
+    """A Message with the `perf_counter` of its send in `sent`.
+
+    Only queued while the broker is instrumented.  The timestamp is an
+    attribute, not a field, so the message still unpacks into 3 values.
+    """
+
+    def __new__(cls, message: MessageType, args: tuple[Any], kwargs: dict[str, Any],
+                sent: float) -> '_TimedMessage':
+        self = super().__new__(cls, message, args, kwargs)
+        self.sent = sent
+        return self
+
+
+class Priority(IntEnum):
+    HIGH = 0
+    NORMAL = 1
+    LOW = 2
+
+
+class Policy(NamedTuple):
+    priority: Priority = Priority.NORMAL
+    coalesce: bool | Callable[[Message, Message], Message] = False
+    key: Callable[..., Hashable] | None = None
+
+
+class Subscription:
+    """A registered callback, returned by `MessageBroker.register`."""
+
+    __slots__ = ('broker', 'callback', 'id', 'name', 'message_types', 'wants_command', 'weak', '__weakref__')
+
+    _ids = count()
+
+    def __init__(self, broker: 'MessageBroker',
+                 callback: Callable[..., Any],
+                 message_types: tuple[MessageType, ...],
+                 wants_command: bool = False,
+                 weak: bool = False) -> None:
+        self.broker = broker
+        self.message_types = message_types
+        self.wants_command = wants_command
+        self.weak = weak
+        self.id = next(Subscription._ids)
+        self.name = getattr(callback, '__qualname__', None) or repr(callback)
+
+        if weak:
+            ref = weakref.WeakMethod if inspect.ismethod(callback) else weakref.ref
+            self.callback = ref(callback, self._expired)
+        else:
+            self.callback = callback
+
+    def __repr__(self) -> str:
+        return f'Subscription({self.callback}, {self.message_types})'
+
+    @property
+    def alive(self) -> bool:
+        return not self.weak or self.callback() is not None
+
+    def unregister(self) -> None:
+        self.broker.unregister(self)
+
+    def _expired(self, ref: weakref.ref) -> None:
+        self.unregister()
+
+    def receiver(self, message_type: MessageType) -> Callable[..., Any]:
+        """Return the function to call for `message_type`."""
+        if not self.weak:
+            return partial(self.callback, message_type) if self.wants_command else self.callback
+
+        ref = self.callback
+        if self.wants_command:
+            def receiver(*args: Any, **kwargs: Any) -> None:
+                if (fn := ref()) is not None:
+                    fn(message_type, *args, **kwargs)
+        else:
+            def receiver(*args: Any, **kwargs: Any) -> None:
+                if (fn := ref()) is not None:
+                    fn(*args, **kwargs)
+
+        return receiver
+
+
 class MessageBroker:
-    def __init__(self) -> None:
-        self._q = queue.SimpleQueue()
-        self._receivers = defaultdict(set)
+    def __init__(self, *,
+                 time_budget: float | None = None,
+                 max_messages: int | None = None) -> None:
+        """Create a message broker.
+
+        :param time_budget: Seconds per tick to spend on dispatching, None
+            for no limit.  At least one message is dispatched per tick.
+        :param max_messages: Maximum number of messages dispatched per tick,
+            None for no limit
+
+        """
+        self.time_budget = time_budget
+        self.max_messages = max_messages
+
+        # list.append is atomic, no lock needed
+        self._pending = []
+        self._carry = []
+
+        # Messages from other threads, see `post`
+        self._inbox = queue.SimpleQueue()
+        self._woken = False
+        # Called by `post`, e.g. to wake up the main loop
+        self.wakeup = None
+
+        self._subscriptions = defaultdict(list)
+        # message type -> tuple of receivers, rebuilt on (un)register
+        self._receivers = {}
+        # message type -> profiler keys of the receivers, see `instrument`
+        self._stat_keys = {}
+
+        self._policies = {}
+        self._prioritized = False
+        # (message type, key) -> index in _pending, for coalescing
+        self._slots = {}
+        self._coalescing = 0
+
+        # Metrics of the last tick
+        self.dispatched = 0
+        self.carried = 0
+        self.max_carried = 0
+        self.coalesced = 0
+
+        # See `instrument`
+        self.stats = None
+        self.slow_handler = None
+        self.slow_handlers = Counter()
+        self._sent = Counter()
+        self._dispatched = Counter()
+
+    def __len__(self) -> int:
+        """Number of messages waiting for dispatch."""
+        return len(self._carry) + len(self._pending) + self._inbox.qsize()
 
     def register(self,
                  callback: Callable[..., Any],
                  *message_types: MessageType,
-                 wants_command: bool = False) -> None:
+                 wants_command: bool = False,
+                 priority: Priority | None = None,
+                 coalesce: bool | Callable[[Message, Message], Message] | None = None,
+                 key: Callable[..., Hashable] | None = None,
+                 weak: bool = False) -> Subscription:
+        """Register `callback` as receiver of `message_types`.
+
+        :param wants_command: Pass the message type as first argument
+        :param weak: Only keep a weak reference to `callback`
+        :param priority: If given, set the priority of the message types
+        :param coalesce: If given, set the coalescing of the message types
+        :param key: If given, set the coalescing key of the message types,
+            messages are only coalesced if `key(*args, **kwargs)` is equal
+
+        See `set_policy`.
+
+        :returns: The subscription, to unregister again
+
+        """
+        subscription = Subscription(self, callback, message_types, wants_command, weak)
+
         for t in message_types:
-            self._receivers[t].add((callback, wants_command))
+            self._subscriptions[t].append(subscription)
+            self._rebuild(t)
+
+            if priority is not None or coalesce is not None or key is not None:
+                policy = self._policies.get(t, Policy())
+                self.set_policy(t,
+                                priority=policy.priority if priority is None else priority,
+                                coalesce=policy.coalesce if coalesce is None else coalesce,
+                                key=policy.key if key is None else key)
+
+        return subscription
+
+    def unregister(self, subscription: Subscription) -> None:
+        """Remove a subscription.
+
+        The message types stay known, so sending them doesn't raise an
+        `UnknownMessageType`, even if no receivers are left.
+
+        """
+        for t in subscription.message_types:
+            subscriptions = self._subscriptions.get(t)
+            if subscriptions is not None and subscription in subscriptions:
+                subscriptions.remove(subscription)
+                self._rebuild(t)
+
+    def _rebuild(self, message_type: MessageType) -> None:
+        subscriptions = self._subscriptions[message_type]
+        self._receivers[message_type] = tuple(s.receiver(message_type) for s in subscriptions)
+        self._stat_keys[message_type] = tuple(f'broker.{message_type}.{s.name}#{s.id}'
+                                              for s in subscriptions)
+
+    def instrument(self, profiler: Profiler | None = None,
+                   slow_handler: float = 0.001) -> Profiler:
+        """Start recording message counts, latencies and receiver timings.
+
+        :param profiler: Where to report to, e.g. `App.profiler`.  By default
+            a new one is created.
+        :param slow_handler: Seconds above which a receiver call is counted
+            in `slow_handlers`
+        :returns: The profiler
+
+        """
+        self.stats = Profiler() if profiler is None else profiler
+        self.slow_handler = slow_handler
+        return self.stats
+
+    def uninstrument(self) -> None:
+        self.stats = None
+        self._sent.clear()
+        self._dispatched.clear()
+
+    def set_policy(self, message_type: MessageType, *,
+                   priority: Priority = Priority.NORMAL,
+                   coalesce: bool | Callable[[Message, Message], Message] = False,
+                   key: Callable[..., Hashable] | None = None) -> None:
+        """Set the dispatch policy of a message type.
+
+        :param priority: Messages are dispatched by priority, then in the
+            order they were sent
+        :param coalesce: `True` to keep only the latest pending message, or
+            a function `merge(old, new)` returning the combined message
+        :param key: Coalesce only messages for which `key(*args, **kwargs)`
+            is equal, by default all pending messages of the type
+
+        """
+        self._policies[message_type] = Policy(priority, coalesce, key)
+        self._prioritized = any(p.priority != Priority.NORMAL for p in self._policies.values())
 
     def reset(self) -> None:
+        self._subscriptions.clear()
         self._receivers.clear()
+        self._policies.clear()
+        self._prioritized = False
 
     def tick(self) -> None:
-        while True:
-            if self._q.empty():
-                break
+        """Dispatch the messages sent up to now.
+
+        Messages sent during the tick are dispatched in the next one.  If the
+        budget runs out, the remaining messages are carried over.
+
+        """
+        # Reset before draining, so a post during the drain wakes up again
+        self._woken = False
+        inbox = self._inbox
+        while not inbox.empty():
+            self._enqueue(inbox.get_nowait())
 
-            try:
-                msg = self._q.get_nowait()
-            except queue.Empty:
-                pass
+        batch, self._pending = self._pending, []
+        self._slots = {}
+        self.coalesced, self._coalescing = self._coalescing, 0
 
-            message, args, kwargs = msg
+        if self._carry:
+            self._carry.extend(batch)
+            batch, self._carry = self._carry, []
 
-            if message not in self._receivers:
-                raise UnknownMessageType(f'Message type {message} is not registered')
+        if self._prioritized:
+            # Stable, so the carry stays ahead within a priority
+            policies = self._policies
+            batch.sort(key=lambda msg: policies[msg.message].priority
+                       if msg.message in policies else Priority.NORMAL)
 
-            for fn, wants_command in self._receivers[message]:
-                if wants_command:
-                    fn(message, *args, **kwargs)
+        limit = len(batch) if self.max_messages is None else min(len(batch), self.max_messages)
+        deadline = None if self.time_budget is None else perf_counter() + self.time_budget
+
+        receivers = self._receivers
+        stats = self.stats
+
+        i = 0
+        try:
+            while i < limit:
+                msg = batch[i]
+                message, args, kwargs = msg
+                i += 1
+
+                try:
+                    fns = receivers[message]
+                except KeyError:
+                    raise UnknownMessageType(f'Message type {message} is not registered') from None
+
+                if stats is None:
+                    for fn in fns:
+                        fn(*args, **kwargs)
                 else:
-                    fn(*args, **kwargs)
+                    self._dispatch_instrumented(message, fns, args, kwargs,
+                                                getattr(msg, 'sent', 0.0))
+
+                if deadline is not None and perf_counter() >= deadline:
+                    break
+        finally:
+            # Also keeps the rest of the batch if a receiver raised
+            self.dispatched = i
+            self.carried = len(batch) - i
+            self.max_carried = max(self.max_carried, self.carried)
+            if self.carried:
+                self._carry = batch[i:]
+
+            if stats is not None:
+                self._record_counts()
+
+    def _dispatch_instrumented(self, message: MessageType, fns: tuple[Callable[..., Any], ...],
+                               args: tuple[Any], kwargs: dict[str, Any], sent: float) -> None:
+        stats = self.stats
+        keys = self._stat_keys[message]
+
+        start = perf_counter()
+        if sent:
+            stats.accumulate(f'broker.{message}.latency', start - sent)
+
+        for fn, key in zip(fns, keys):
+            fn(*args, **kwargs)
+            end = perf_counter()
+
+            elapsed = end - start
+            stats.accumulate(key, elapsed)
+            if elapsed > self.slow_handler:
+                self.slow_handlers[key] += 1
+
+            start = end
+
+        self._dispatched[message] += 1
+
+    def _record_counts(self) -> None:
+        stats = self.stats
+        for kind, counts in (('sent', self._sent), ('dispatched', self._dispatched)):
+            for message, n in counts.items():
+                key = f'broker.{message}.{kind}'
+                if key not in stats.histograms:
+                    stats.set_histogram(key, COUNT_RANGE)
+                stats.accumulate(key, n)
+
+        self._sent.clear()
+        self._dispatched.clear()
 
     def send(self, message: MessageType, *args: Any, **kwargs: Any) -> None:
-        message = Message(message, args, kwargs)
-        self._q.put(message)
+        if self.stats is None:
+            self._enqueue(Message(message, args, kwargs))
+        else:
+            self._enqueue(_TimedMessage(message, args, kwargs, perf_counter()))
+
+    def _enqueue(self, msg: Message) -> None:
+        message = msg.message
+        if self.stats is not None:
+            self._sent[message] += 1
+
+        policy = self._policies.get(message)
+        if policy is None or not policy.coalesce:
+            self._pending.append(msg)
+            return
+
+        slot = (message, None if policy.key is None else policy.key(*msg.args, **msg.kwargs))
+        try:
+            i = self._slots[slot]
+        except KeyError:
+            self._slots[slot] = len(self._pending)
+            self._pending.append(msg)
+            return
+
+        if policy.coalesce is not True:
+            sent = getattr(msg, 'sent', None)
+            msg = policy.coalesce(self._pending[i], msg)
+            if sent is not None and not isinstance(msg, _TimedMessage):
+                msg = _TimedMessage(*msg, sent)
+        self._pending[i] = msg
+        self._coalescing += 1
+
+    def post(self, message: MessageType, *args: Any, **kwargs: Any) -> None:
+        """Send a message from any thread.
+
+        The message is dispatched in the next `tick`.  Unlike `send`, this
+        takes a lock, and calls `wakeup` once until the next tick.
+
+        """
+        if self.stats is None:
+            self._inbox.put(Message(message, args, kwargs))
+        else:
+            self._inbox.put(_TimedMessage(message, args, kwargs, perf_counter()))
+
+        if not self._woken and self.wakeup is not None:
+            self._woken = True
+            self.wakeup()
+
+    def post_when_done(self, future: Future, message: MessageType,
+                       *args: Any, **kwargs: Any) -> Future:
+        """Post `message` with `future` as first argument when it is done.
+
+        The receiver gets the result with `future.result()`, which re-raises
+        the exception of a failed future.
+
+        """
+        future.add_done_callback(lambda f: self.post(message, f, *args, **kwargs))
+        return future
+
+    def wait_for(self, message_type: MessageType) -> asyncio.Future:
+        """Return an asyncio future for the next message of `message_type`.
+
+        The result is the `Message`.  Must be called from the running event
+        loop, which is the thread calling `tick`.
+
+        """
+        future = asyncio.get_running_loop().create_future()
+
+        def receiver(*args: Any, **kwargs: Any) -> None:
+            if not future.done():
+                future.set_result(Message(message_type, args, kwargs))
+
+        subscription = self.register(receiver, message_type)
+        future.add_done_callback(lambda f: subscription.unregister())
+        return future
 
 
 broker = MessageBroker()
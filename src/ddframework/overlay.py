@@ -0,0 +1,150 @@
+"""An in-game performance overlay.
+
+Push it on top of the running state, letting everything pass through:
+
+    app.push(PerfOverlay(app), StackPermissions.ALL)
+
+It shows a frame time graph against the frame budget, and the profiler
+stats of the main stages.  Pressing the toggle key (F3 by default) pops it
+again.
+
+Text is drawn from a cache of glyph textures, so changing numbers don't
+cause any font rendering or texture creation after the first frames.  The
+overlay measures its own cost per frame as `PerfOverlay.frame`, and shows
+it in the last line.
+"""
+
+from collections import deque
+from time import perf_counter
+from typing import Any
+
+import pygame
+import pygame._sdl2 as sdl2
+
+from pygame.typing import ColorLike, Point
+
+from ddframework.app import App, GameState, StateExit
+
+__all__ = ['GlyphCache', 'PerfOverlay']
+
+
+class GlyphCache:
+    """Render text from per-character textures.
+
+    Every character is rendered and uploaded once, on first use.  Good for
+    text that changes every frame, like numbers.
+    """
+
+    def __init__(self, renderer: sdl2.Renderer, font: pygame.Font,
+                 color: ColorLike = 'white') -> None:
+        self.renderer = renderer
+        self.font = font
+        self.color = color
+        self.glyphs = {}
+
+    def glyph(self, char: str) -> sdl2.Texture:
+        try:
+            return self.glyphs[char]
+        except KeyError:
+            pass
+
+        surface = self.font.render(char, True, self.color)
+        texture = sdl2.Texture.from_surface(self.renderer, surface)
+        self.glyphs[char] = texture
+        return texture
+
+    def draw(self, text: str, pos: Point) -> None:
+        """Draw `text` with its topleft at `pos`."""
+        x, y = pos
+        for char in text:
+            texture = self.glyph(char)
+            texture.draw(dstrect=(x, y, texture.width, texture.height))
+            x += texture.width
+
+
+class PerfOverlay(GameState):
+    event_types = (pygame.KEYDOWN, )
+
+    def __init__(self, app: App, *,
+                 stats: tuple[str, ...] = ('frame', 'events', 'update', 'draw'),
+                 pos: Point = (8, 8),
+                 size: Point = (240, 64),
+                 font: pygame.Font | None = None,
+                 toggle: int = pygame.K_F3) -> None:
+        """Create the overlay.
+
+        :param stats: Profiler stats to list below the graph
+        :param pos: Topleft of the overlay in logical coordinates
+        :param size: Size of the frame time graph, the width is also the
+            number of frames shown
+        :param font: Defaults to the pygame default font in size 16
+        :param toggle: Key to close the overlay
+
+        """
+        super().__init__(app)
+
+        if font is None:
+            pygame.font.init()
+            font = pygame.font.Font(None, 16)
+
+        self.stats = stats
+        self.toggle = toggle
+        self.graph = pygame.Rect(pos, size)
+        self.history = deque([], maxlen=self.graph.width)
+
+        self.text = GlyphCache(app.renderer, font)
+        self.line_height = font.get_linesize()
+
+    def reset(self, *args: Any, **kwargs: Any) -> None:
+        self.history.clear()
+
+    def dispatch_event(self, e: pygame.event.Event) -> None:
+        if e.type == pygame.KEYDOWN and e.key == self.toggle:
+            raise StateExit(-1)
+
+    def update(self, dt: float) -> None:
+        # Sampled in `draw`, update runs 0 - max_steps times per frame with
+        # a fixed timestep.
+        pass
+
+    def draw(self) -> None:
+        start = perf_counter()
+
+        renderer = self.app.renderer
+        profiler = self.app.profiler
+        self.history.append(profiler.latest('frame'))
+        graph = self.graph
+        budget = 1 / self.app.fps
+
+        background = graph.inflate(8, 8)
+        background.height += self.line_height * (len(self.stats) + 1)
+
+        bkp_blend_mode = renderer.draw_blend_mode
+        renderer.draw_blend_mode = 1  # SDL_BLENDMODE_BLEND
+        renderer.draw_color = (0, 0, 0, 192)
+        renderer.fill_rect(background)
+        renderer.draw_blend_mode = bkp_blend_mode
+
+        # The graph spans 0 - 2x the frame budget, bars above budget are red
+        scale = graph.height / (2 * budget)
+        for x, value in enumerate(self.history, graph.left):
+            height = min(value * scale, graph.height)
+            renderer.draw_color = 'red' if value > budget else 'green'
+            renderer.draw_line((x, graph.bottom), (x, graph.bottom - height))
+
+        renderer.draw_color = 'yellow'
+        renderer.draw_line((graph.left, graph.centery), (graph.right, graph.centery))
+
+        y = graph.bottom + 4
+        for key in self.stats:
+            stat = profiler[key]
+            self.text.draw(f'{key:8s}{stat.avg * 1000:7.2f}{stat.p99 * 1000:7.2f}{stat.max * 1000:7.2f} ms',
+                           (graph.left, y))
+            y += self.line_height
+
+        own = profiler['PerfOverlay.frame']
+        self.text.draw(f'{"overlay":8s}{own.avg * 1000:7.2f}{own.p99 * 1000:7.2f}{own.max * 1000:7.2f} ms',
+                       (graph.left, y))
+
+        if profiler.enabled:
+            profiler.accumulate('PerfOverlay.frame', perf_counter() - start)
@@ -0,0 +1,105 @@
+"""A frame pacer with sub-millisecond precision.
+
+`pygame.time.Clock.tick` sleeps with millisecond granularity and tends to
+oversleep, which shows up as jitter at higher frame rates.  The FramePacer
+sleeps coarsely until shortly before the frame deadline, and then spins on
+`perf_counter` for the rest.
+
+    pacer = FramePacer()
+    app = App(..., pacer=pacer)
+
+After each `tick`, `miss` holds how far the deadline was overshot, and
+`skip_draw` tells if the loop is so far behind that rendering this frame
+should be dropped to let the simulation catch up.
+"""
+
+from collections import deque
+from collections.abc import Callable
+from time import perf_counter, sleep
+
+__all__ = ['FramePacer']
+
+
+class FramePacer:
+    def __init__(self, spin: float = 0.002, max_skips: int = 5, *,
+                 clock: Callable[[], float] = perf_counter,
+                 sleep: Callable[[float], None] = sleep) -> None:
+        """Create a frame pacer.
+
+        :param spin: Seconds before the deadline to stop sleeping and start
+            spinning.  Should be larger than the OS sleep granularity.
+        :param max_skips: Maximum number of frames in a row for which
+            `skip_draw` is set, so rendering never starves completely.
+        :param clock: Returns the current time in seconds
+        :param sleep: Sleeps for the given seconds
+
+        """
+        self.spin = spin
+        self.max_skips = max_skips
+        self.clock = clock
+        self.sleep = sleep
+
+        self.deadline = None
+        self.last = None
+        self.miss = 0.0
+        self.skip_draw = False
+        self.skipped = 0
+
+        self._dts = deque([], maxlen=10)
+
+    def tick(self, fps: float) -> float:
+        """Wait for the next frame deadline and return the frame time in seconds.
+
+        An `fps` of 0 doesn't wait at all, like `Clock.tick`.
+
+        """
+        clock = self.clock
+        now = clock()
+
+        if self.last is None:
+            self.last = self.deadline = now
+            return 0.0
+
+        if fps > 0:
+            frame_time = 1 / fps
+            self.deadline += frame_time
+
+            remaining = self.deadline - now - self.spin
+            if remaining > 0:
+                self.sleep(remaining)
+
+            while (now := clock()) < self.deadline:
+                pass
+
+            self.miss = now - self.deadline
+
+            # Behind by more than a full frame: drop rendering to catch up,
+            # or give up on the backlog if that didn't help.
+            if self.miss > frame_time and self.skipped < self.max_skips:
+                self.skip_draw = True
+                self.skipped += 1
+            else:
+                if self.miss > frame_time:
+                    self.deadline = now
+                self.skip_draw = False
+                self.skipped = 0
+        else:
+            self.deadline = now
+            self.miss = 0.0
+            self.skip_draw = False
+
+        dt = now - self.last
+        self.last = now
+        self._dts.append(dt)
+
+        return dt
+
+    def resync(self) -> None:
+        """Restart the schedule from now, e.g. after idling on purpose."""
+        if self.last is not None:
+            self.deadline = self.clock()
+
+    def get_fps(self) -> float:
+        """Return the average frame rate over the last 10 frames."""
+        total = sum(self._dts)
+        return len(self._dts) / total if total else 0.0
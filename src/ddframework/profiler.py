@@ -10,14 +10,194 @@
 
 """
 
+import json
+import os
+import threading
+
+from array import array
 from collections import defaultdict, deque, UserDict
+from collections.abc import Callable, Collection
 from dataclasses import dataclass
-from contextlib import contextmanager
+from contextlib import nullcontext
+from functools import wraps
+from math import ceil, log2, nan
+from pathlib import Path
 from time import perf_counter
+from typing import Any, TextIO
 
-# Deque is faster but cannot be resized during runtime. So define it here.
+# Default size of the sliding window, see `Profiler.set_window`
 ACCUMULATE_LIMIT = 60
 
+# Histogram range and resolution.  16 buckets per doubling keep the error of
+# a percentile below 2.2%, 1µs - 16s need 384 buckets.
+HISTOGRAM_MIN = 1e-6
+HISTOGRAM_BUCKETS_PER_DOUBLING = 16
+HISTOGRAM_DOUBLINGS = 24
+
+# Histogram ranges (minimum, doublings), for times in seconds, the default,
+# and for positive counts up to about 4 billion
+TIME_RANGE = (HISTOGRAM_MIN, HISTOGRAM_DOUBLINGS)
+COUNT_RANGE = (1.0, 32)
+
+
+class Histogram:
+    """
+    Fixed memory histogram with logarithmic buckets.
+
+    The range covers `minimum` to `minimum * 2 ** doublings`.  Values below
+    or above it end up in the first or last bucket.
+    """
+
+    def __init__(self, minimum: float = HISTOGRAM_MIN,
+                 doublings: int = HISTOGRAM_DOUBLINGS) -> None:
+        self.minimum = minimum
+        self.buckets = array("Q", bytes(8 * HISTOGRAM_BUCKETS_PER_DOUBLING * doublings))
+        self.count = 0
+
+    def add(self, value: float) -> None:
+        """
+        Count a value.
+
+        Parameters
+        ----------
+        value
+            The value to count.
+        """
+
+        if value > self.minimum:
+            idx = min(int(log2(value / self.minimum) * HISTOGRAM_BUCKETS_PER_DOUBLING),
+                      len(self.buckets) - 1)
+        else:
+            idx = 0
+
+        self.buckets[idx] += 1
+        self.count += 1
+
+    def percentile(self, q: float) -> float:
+        """
+        Return the approximated value below which `q` percent of all values are.
+
+        Parameters
+        ----------
+        q
+            Percentile, 0 - 100.
+        """
+
+        if not self.count:
+            return 0.0
+
+        rank = max(ceil(q / 100 * self.count), 1)
+        seen = 0
+        for idx, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                # Geometric center of the bucket
+                return self.minimum * 2 ** ((idx + 0.5) / HISTOGRAM_BUCKETS_PER_DOUBLING)
+
+        return self.minimum * 2 ** ((len(self.buckets) - 0.5) / HISTOGRAM_BUCKETS_PER_DOUBLING)
+
+
+class Accumulator:
+    """
+    Constant time sliding window statistics for a single stat.
+
+    The window is a ring buffer of floats.  The sum is kept running, min and
+    max come from monotonic queues of sample indices, so no operation needs
+    to look at the whole window.  Session totals and the histogram are not
+    limited to the window.
+    """
+
+    __slots__ = ("window", "values", "sum", "minq", "maxq", "latest",
+                 "count", "total", "over_budget", "histogram")
+
+    def __init__(self, window: int = ACCUMULATE_LIMIT,
+                 histogram: tuple[float, int] | None = TIME_RANGE) -> None:
+        self.window = window
+        self.values = array("d", bytes(8 * window))
+        self.sum = 0.0
+        self.minq = deque()
+        self.maxq = deque()
+        self.latest = 0.0
+
+        self.count = 0
+        self.total = 0.0
+        self.over_budget = 0
+        # (minimum, doublings) of the histogram, None for no percentiles
+        self.histogram = Histogram(*histogram) if histogram is not None else None
+
+    def add(self, value: float) -> None:
+        """
+        Add a value to the window.
+
+        Parameters
+        ----------
+        value
+            The value to add.
+        """
+
+        idx = self.count
+        window = self.window
+        values = self.values
+        pos = idx % window
+
+        self.sum += value - values[pos]
+        values[pos] = value
+
+        # Drop indices that left the window, then those that can never be
+        # the min/max again, because the new value is smaller/larger.
+        minq = self.minq
+        if minq and minq[0] <= idx - window:
+            minq.popleft()
+        while minq and values[minq[-1] % window] >= value:
+            minq.pop()
+        minq.append(idx)
+
+        maxq = self.maxq
+        if maxq and maxq[0] <= idx - window:
+            maxq.popleft()
+        while maxq and values[maxq[-1] % window] <= value:
+            maxq.pop()
+        maxq.append(idx)
+
+        # Resum once per cycle, so float errors can't pile up
+        if pos == window - 1:
+            self.sum = sum(values)
+
+        self.latest = value
+        self.count += 1
+        self.total += value
+        if self.histogram is not None:
+            self.histogram.add(value)
+
+    @property
+    def avg(self) -> float:
+        n = min(self.count, self.window)
+        return self.sum / n if n else 0.0
+
+    @property
+    def sma(self) -> float:
+        return self.sum / self.window
+
+    @property
+    def min(self) -> float:
+        return self.values[self.minq[0] % self.window] if self.minq else 0.0
+
+    @property
+    def max(self) -> float:
+        return self.values[self.maxq[0] % self.window] if self.maxq else 0.0
+
+    def percentile(self, q: float) -> float:
+        """ Return a session percentile, see `Histogram`, NaN without a histogram. """
+        return self.histogram.percentile(q) if self.histogram is not None else nan
+
+
+@dataclass(slots=True)
+class ScopeStat:
+    """Time spent in one scope path, with and without its child scopes."""
+    total: float = 0.0
+    self_time: float = 0.0
+    count: int = 0
+
 
 @dataclass
 class ProfiledStat:
@@ -26,9 +206,15 @@ class ProfiledStat:
     max: float
     sma: float
     latest: float
+    p50: float = 0.0
+    p90: float = 0.0
+    p99: float = 0.0
+    p999: float = 0.0
+    over_budget: int = 0
 
     def __str__(self) -> str:
-        return ' '.join(str(_) for _ in (self.avg, self.sma, self.min, self.max, self.latest))
+        return ' '.join(str(_) for _ in (self.avg, self.sma, self.min, self.max, self.latest,
+                                         self.p50, self.p90, self.p99, self.p999, self.over_budget))
         return f"err={abs(self.avg - self.sma): .10f}  avg={self.avg: .10f}  sma={self.sma: .10f}  min={self.min: .10f}  max={self.max: .10f}  latest={self.latest: .10f}"
 
     def __iter__(self):
@@ -37,48 +223,259 @@ class ProfiledStat:
         yield self.max
         yield self.sma
         yield self.latest
+        yield self.p50
+        yield self.p90
+        yield self.p99
+        yield self.p999
+        yield self.over_budget
+
+
+class _Stats(dict):
+    """ Stat storage that creates missing stats with their configured window. """
+
+    def __init__(self, profiler: "Profiler") -> None:
+        super().__init__()
+        self.profiler = profiler
+
+    def __missing__(self, stat: str) -> Accumulator:
+        profiler = self.profiler
+        acc = self[stat] = Accumulator(profiler.windows.get(stat, profiler.window),
+                                       profiler.histograms.get(stat, profiler.histogram))
+        return acc
 
 
 class Profiler(UserDict):
     """
     Profiler and stat storage class.
+
+    Besides the sliding window stats, a histogram over the whole session is
+    kept per stat for percentiles.  Its range is `histogram`, by default
+    `TIME_RANGE`, or per stat set with `set_histogram`.  Values of the stats in `budget_keys`
+    (by default only the frame time) above `budget` are counted as
+    `over_budget`.  Other stats, like counts or the session total, are not
+    compared to the budget.  A `budget_keys` of None applies it to all stats.
+
+    Nested `profile` scopes are also aggregated by their path, e.g.
+    `total;update;Game`, in `scopes`.  See `collapsed` for flame graphs.
+
+    With `enabled` set to False, `profile` returns a shared no-op context
+    manager and nothing is measured at all.
+
+    Between `start_trace` and `stop_trace`, every single scope is recorded
+    with its start time and duration, see `write_trace`.
     """
 
-    def __init__(self) -> None:
-        def factory() -> dict:
-            return {"avg": 0.0, "min": 0.0, "max": 0.0, "sma": 0.0, "latest":
-                    0.0, "acc": deque([], maxlen=ACCUMULATE_LIMIT)}
+    def __init__(self, budget: float | None = None, window: int = ACCUMULATE_LIMIT,
+                 budget_keys: Collection[str] | None = frozenset({"frame"}),
+                 histogram: tuple[float, int] | None = TIME_RANGE) -> None:
+        self.data = _Stats(self)
+        self.budget = budget
+        self.budget_keys = budget_keys
+        self.window = window
+        self.histogram = histogram
+        # Per-stat window sizes and histogram ranges, see `set_window` and
+        # `set_histogram`.  Kept across `reset`.
+        self.windows = {}
+        self.histograms = {}
+        self.enabled = True
+
+        self.scopes = defaultdict(ScopeStat)
+        # Paths of the open scopes, and the time spent in their children
+        self._paths = []
+        self._children = []
 
-        self.data = defaultdict(factory)
+        # (stat, start, elapsed) of every scope while tracing, else None
+        self.trace = None
 
     def __getitem__(self, key: str) -> ProfiledStat:
         """ Return a profiled stat. """
+        t = self.data[key]
         return ProfiledStat(
-            self.data[key]["avg"],
-            self.data[key]["min"],
-            self.data[key]["max"],
-            self.data[key]["sma"],
-            self.data[key]["latest"],
+            t.avg,
+            t.min,
+            t.max,
+            t.sma,
+            t.latest,
+            t.percentile(50),
+            t.percentile(90),
+            t.percentile(99),
+            t.percentile(99.9),
+            t.over_budget,
         )
 
-    @contextmanager
-    def profile(self, stat: str) -> None:
+    def set_window(self, stat: str, window: int) -> None:
+        """
+        Set the sliding window size of a stat, discarding its window.
+
+        The size is kept when the profiler is reset.
+
+        Parameters
+        ----------
+        stat
+            Stat name.
+        window
+            Number of samples for avg, min, max and sma.
+        """
+
+        self.windows[stat] = window
+        self.data.pop(stat, None)
+
+    def set_histogram(self, stat: str, histogram: tuple[float, int] | None) -> None:
+        """
+        Set the histogram range of a stat, discarding its values.
+
+        The range is kept when the profiler is reset.
+
+        Parameters
+        ----------
+        stat
+            Stat name.
+        histogram
+            (minimum, doublings) of the histogram, e.g. `(1, 32)` for counts
+            up to 4 billion.  None disables percentiles, e.g. for values
+            that can be zero or negative.
+        """
+
+        self.histograms[stat] = histogram
+        self.data.pop(stat, None)
+
+    def latest(self, stat: str) -> float:
+        """ Return the latest value of a stat without creating a ProfiledStat. """
+        return self.data[stat].latest
+
+    def reset(self) -> None:
+        """ Forget all stats and scopes, but not the window sizes. """
+        self.data.clear()
+        self.scopes.clear()
+
+    def report(self) -> dict[str, dict[str, float]]:
+        """
+        Return all stats as plain dicts, e.g. for a JSON dump.
+
+        In addition to the `ProfiledStat` fields, `count`, `sum` and `mean`
+        cover the whole session.  Percentiles of stats without a histogram
+        are None.
+        """
+
+        def percentile(t: Accumulator, q: float) -> float | None:
+            return t.histogram.percentile(q) if t.histogram is not None else None
+
+        return {
+            key: {
+                "count": t.count,
+                "sum": t.total,
+                "mean": t.total / t.count if t.count else 0.0,
+                "avg": t.avg,
+                "min": t.min,
+                "max": t.max,
+                "sma": t.sma,
+                "latest": t.latest,
+                "p50": percentile(t, 50),
+                "p90": percentile(t, 90),
+                "p99": percentile(t, 99),
+                "p999": percentile(t, 99.9),
+                "over_budget": t.over_budget,
+            }
+            for key, t in self.data.items()
+        }
+
+    def profile(self, stat: str) -> "Scope | nullcontext":
         """
         Profile piece of code.
 
+            with profiler.profile('update'):
+                ...
+
         Parameters
         ----------
         stat
             Stat name to store the profiled code as.
         """
 
-        start = perf_counter()
+        return Scope(self, stat) if self.enabled else _DISABLED
+
+    def start_trace(self) -> None:
+        """ Start recording every scope, dropping a previous trace. """
+        self.trace = []
+
+    def stop_trace(self) -> list[tuple[str, float, float]]:
+        """ Stop recording scopes and return the trace. """
+        trace, self.trace = self.trace, None
+        return trace if trace is not None else []
 
-        try: yield None
+    def trace_events(self, trace: list[tuple[str, float, float]] | None = None) -> dict:
+        """
+        Return a trace in the Trace Event Format of chrome://tracing and Perfetto.
+
+        Parameters
+        ----------
+        trace
+            A trace from `stop_trace`, defaults to the running one.
+        """
 
-        finally:
-            elapsed = perf_counter() - start
-            self.accumulate(stat, elapsed)
+        if trace is None:
+            trace = self.trace or []
+
+        pid = os.getpid()
+        tid = threading.main_thread().native_id
+        t0 = min((start for _, start, _ in trace), default=0.0)
+
+        return {
+            "traceEvents": [
+                {"name": stat, "cat": "profile", "ph": "X", "pid": pid, "tid": tid,
+                 "ts": (start - t0) * 1e6, "dur": elapsed * 1e6}
+                for stat, start, elapsed in trace
+            ],
+            "displayTimeUnit": "ms",
+        }
+
+    def write_trace(self, file: str | Path | TextIO,
+                    trace: list[tuple[str, float, float]] | None = None) -> None:
+        """
+        Write a trace as JSON, to be loaded into a trace viewer.
+
+        Parameters
+        ----------
+        file
+            File name or open text file.
+        trace
+            A trace from `stop_trace`, defaults to the running one.
+        """
+
+        events = self.trace_events(trace)
+        if isinstance(file, (str, Path)):
+            with open(file, "w") as f:
+                json.dump(events, f)
+        else:
+            json.dump(events, file)
+
+    def collapsed(self) -> list[str]:
+        """
+        Return the scopes in the collapsed stack format of flame graph tools.
+
+        Each line is the scope path and its self time in microseconds.
+        """
+
+        return [f"{path} {round(scope.self_time * 1e6)}"
+                for path, scope in self.scopes.items()
+                if round(scope.self_time * 1e6) > 0]
+
+    def write_collapsed(self, file: str | Path | TextIO) -> None:
+        """
+        Write the collapsed stacks, e.g. for `flamegraph.pl`.
+
+        Parameters
+        ----------
+        file
+            File name or open text file.
+        """
+
+        lines = "".join(f"{line}\n" for line in self.collapsed())
+        if isinstance(file, (str, Path)):
+            with open(file, "w") as f:
+                f.write(lines)
+        else:
+            file.write(lines)
 
     def accumulate(self, stat: str, value: float) -> None:
         """
@@ -93,13 +490,111 @@ class Profiler(UserDict):
         """
 
         t = self.data[stat]
-        acc = t["acc"]
-        acc.append(value)
+        t.add(value)
+        if (self.budget is not None and value > self.budget
+                and (self.budget_keys is None or stat in self.budget_keys)):
+            t.over_budget += 1
+
+
+class Scope:
+    """
+    Context manager measuring a block, see `Profiler.profile`.
+
+    A plain class instead of a `contextmanager` generator, since it is
+    entered several times every frame.
+    """
+
+    __slots__ = ("profiler", "stat", "start")
+
+    def __init__(self, profiler: Profiler, stat: str) -> None:
+        self.profiler = profiler
+        self.stat = stat
+
+    def __enter__(self) -> None:
+        paths = self.profiler._paths
+        paths.append(f"{paths[-1]};{self.stat}" if paths else self.stat)
+        self.profiler._children.append(0.0)
 
-        t["avg"] = sum(acc) / len(acc)
-        t["min"] = min(acc)
-        t["max"] = max(acc)
-        t["sma"] += (value - acc[0]) / ACCUMULATE_LIMIT
-        t["latest"] = value
+        self.start = perf_counter()
+
+    def __exit__(self, *exc: object) -> None:
+        elapsed = perf_counter() - self.start
+
+        profiler = self.profiler
+        children = profiler._children
+        profiler.accumulate(self.stat, elapsed)
+
+        if profiler.trace is not None:
+            profiler.trace.append((self.stat, self.start, elapsed))
+
+        scope = profiler.scopes[profiler._paths.pop()]
+        scope.total += elapsed
+        scope.self_time += elapsed - children.pop()
+        scope.count += 1
+        if children:
+            children[-1] += elapsed
+
+
+_DISABLED = nullcontext()
 
 profiler = Profiler()
+
+
+def _instrument(fn: Callable, scope: str, profiler: Profiler) -> Callable:
+    @wraps(fn)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        if not profiler.enabled:
+            return fn(*args, **kwargs)
+
+        with Scope(profiler, scope):
+            return fn(*args, **kwargs)
+
+    wrapper.__profiled__ = True
+    return wrapper
+
+
+def profiled(scope: str | None = None, profiler: Profiler = profiler) -> Callable:
+    """
+    Decorator to run a function in a profiler scope.
+
+        @profiled()
+        def on_score(points):
+            ...
+
+    If the profiler is disabled, the function is called directly.
+
+    Parameters
+    ----------
+    scope
+        Scope name, defaults to the qualified name of the function.
+    profiler
+        Defaults to the global profiler.
+    """
+
+    def decorator(fn: Callable) -> Callable:
+        return _instrument(fn, scope if scope is not None else fn.__qualname__, profiler)
+
+    return decorator
+
+
+class Profiled:
+    """
+    Class hook to profile methods, named after the class.
+
+        class Particle(Profiled, Sprite):
+            profiled_methods = ('update', )
+
+    Every subclass wraps the methods from `profiled_methods` it defines
+    itself into a scope with its class name on the global profiler, so a
+    `super().update()` shows up as a nested scope of the parent class.
+    """
+
+    profiled_methods: tuple[str, ...] = ()
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+
+        for name in cls.profiled_methods:
+            fn = cls.__dict__.get(name)
+            if fn is not None and not getattr(fn, "__profiled__", False):
+                setattr(cls, name, _instrument(fn, cls.__name__, profiler))
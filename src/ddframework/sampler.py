@@ -0,0 +1,125 @@
+"""A statistical profiler attributed to GameStates.
+
+A background thread looks at the Python stack of the main thread every
+`interval` seconds.  Each sample is tagged with the class name of the top
+GameState and the stage of the App (events, update or draw), so without
+any instrumentation, you get the hot functions per state.
+
+    with Sampler(app) as sampler:
+        app.run(walker)
+
+    sampler.print_report()
+
+Sampling costs a bit of GIL time per sample, but nothing in the main loop
+itself.
+"""
+
+import sys
+import threading
+
+from collections import Counter, defaultdict
+from types import CodeType
+from typing import Any, Self
+
+__all__ = ['Sampler']
+
+
+def _describe(code: CodeType) -> str:
+    return f'{code.co_qualname} ({code.co_filename}:{code.co_firstlineno})'
+
+
+class Sampler:
+    def __init__(self, app: Any, interval: float = 0.005) -> None:
+        """Create a sampler for the main thread of `app`.
+
+        :param app: The App, only its `state_stack` and `stage` are used
+        :param interval: Seconds between samples
+
+        """
+        self.app = app
+        self.interval = interval
+
+        # (state, stage) -> Counter of code objects.  `own` counts the
+        # innermost function only, `cumulative` every function on the stack.
+        self.own = defaultdict(Counter)
+        self.cumulative = defaultdict(Counter)
+        self.samples = Counter()
+
+        self._thread = None
+        self._stop = threading.Event()
+
+    def __enter__(self) -> Self:
+        self.start()
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        """Start sampling the thread this is called from."""
+        self._target = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='Sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop sampling and wait for the sampler thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def sample(self) -> None:
+        """Take a single sample of the target thread."""
+        frame = sys._current_frames().get(self._target)
+        if frame is None:
+            return
+
+        # The main thread changes the stack under our feet, so grab it once
+        try:
+            state = type(self.app.state_stack[-1].state).__name__
+        except IndexError:
+            state = None
+        key = (state, getattr(self.app, 'stage', None))
+
+        self.samples[key] += 1
+        self.own[key][frame.f_code] += 1
+
+        seen = set()
+        while frame is not None:
+            seen.add(frame.f_code)
+            frame = frame.f_back
+        self.cumulative[key].update(seen)
+
+    def table(self, state: str | None = None, stage: str | None = None,
+              top: int = 20, cumulative: bool = False) -> list[tuple[str, int, float]]:
+        """Return the hottest functions as (function, samples, fraction).
+
+        :param state: Only samples of this state class, all if None
+        :param stage: Only samples of this App stage, all if None
+        :param top: Number of functions to return
+        :param cumulative: Count functions anywhere on the stack, not only
+            where the time was actually spent
+
+        """
+        counts = Counter()
+        total = 0
+        source = self.cumulative if cumulative else self.own
+        for (s, g), counter in source.items():
+            if (state is None or s == state) and (stage is None or g == stage):
+                counts.update(counter)
+                total += self.samples[(s, g)]
+
+        return [(_describe(code), n, n / total)
+                for code, n in counts.most_common(top)]
+
+    def print_report(self, top: int = 10) -> None:
+        """Print a hot function table for every state and stage."""
+        for (state, stage), n in sorted(self.samples.items(), key=lambda kv: -kv[1]):
+            print(f'{state} / {stage}: {n} samples')
+            for function, count, fraction in self.table(state, stage, top):
+                print(f'    {fraction:6.1%}  {count:6d}  {function}')
@@ -0,0 +1,130 @@
+"""Record per-frame profiler samples without disturbing the frame times.
+
+Printing the profiler stats every frame costs more than some of the stages
+it measures.  The TelemetrySink copies the latest values of a few stats into
+a preallocated ring buffer instead, and writes the buffer out in bulk when it
+is full, and when the sink is closed.
+
+    with TelemetrySink('trace.csv') as sink:
+        app.run(walker, perftrace=sink)
+
+The output format is CSV or JSON Lines, chosen by the file suffix or the
+`format` parameter.  Each row contains the frame number, a `perf_counter`
+timestamp and one column per stat.  Stats that were not measured in a
+frame, e.g. `draw` on a frame that skipped drawing, are recorded as NaN,
+which is written as `nan` to CSV and `null` to JSON Lines.
+"""
+
+import csv
+import json
+
+from array import array
+from math import isnan, nan
+from pathlib import Path
+from time import perf_counter
+from typing import Iterable, Self, TextIO
+
+from ddframework.profiler import Profiler
+
+__all__ = ['TelemetrySink']
+
+
+class TelemetrySink:
+    def __init__(self, file: str | Path | TextIO,
+                 keys: Iterable[str] = ('events', 'update', 'draw'),
+                 capacity: int = 1024,
+                 format: str | None = None) -> None:
+        """Create a telemetry sink.
+
+        :param file: File name or open text file to write to
+        :param keys: The profiler stats to record
+        :param capacity: Number of frames to buffer before writing
+        :param format: 'csv' or 'jsonl', by default derived from the file
+            name, falling back to 'csv'
+
+        """
+        if format is None:
+            format = 'jsonl' if str(file).endswith(('.jsonl', '.json')) else 'csv'
+        if format not in ('csv', 'jsonl'):
+            raise ValueError(f'Unknown telemetry format {format}')
+
+        self.format = format
+        self.keys = tuple(keys)
+        self.fields = ('frame', 'time') + self.keys
+        self.capacity = capacity
+
+        self.width = len(self.fields)
+        self.buffer = array('d', bytes(8 * self.width * capacity))
+        self.count = 0
+        self.frame = 0
+        self._counts = dict.fromkeys(self.keys, 0)
+
+        if isinstance(file, (str, Path)):
+            self.file = open(file, 'w', newline='')
+            self._owned = True
+        else:
+            self.file = file
+            self._owned = False
+
+        if format == 'csv':
+            self._csv = csv.writer(self.file)
+            self._csv.writerow(self.fields)
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+    def record(self, profiler: Profiler) -> None:
+        """Store the latest values of the profiler stats for this frame.
+
+        A stat whose count did not change since the previous frame is stored
+        as NaN instead of repeating its previous value.
+
+        """
+        i = self.count * self.width
+        buffer = self.buffer
+        counts = self._counts
+
+        buffer[i] = self.frame
+        buffer[i + 1] = perf_counter()
+        for j, key in enumerate(self.keys, i + 2):
+            stat = profiler.data[key]
+            if stat.count != counts[key]:
+                counts[key] = stat.count
+                buffer[j] = stat.latest
+            else:
+                buffer[j] = nan
+
+        self.count += 1
+        self.frame += 1
+
+        if self.count == self.capacity:
+            self.flush()
+
+    def rows(self) -> Iterable[list[float]]:
+        """Return the buffered rows, oldest first."""
+        w = self.width
+        for i in range(0, self.count * w, w):
+            row = self.buffer[i:i + w].tolist()
+            row[0] = int(row[0])
+            yield row
+
+    def flush(self) -> None:
+        """Write all buffered rows out and empty the buffer."""
+        if self.format == 'csv':
+            self._csv.writerows(self.rows())
+        else:
+            self.file.writelines(json.dumps({field: None if isnan(value) else value
+                                             for field, value in zip(self.fields, row)}) + '\n'
+                                 for row in self.rows())
+
+        self.file.flush()
+        self.count = 0
+
+    def close(self) -> None:
+        """Flush, and close the file if the sink opened it."""
+        self.flush()
+        if self._owned:
+            self.file.close()
@@ -1,4 +1,8 @@
-from collections.abc import Iterator
+import sys
+
+from collections.abc import Callable, Iterator
+from functools import partial
+from operator import itemgetter
 from random import random
 
 import glm
@@ -46,11 +50,32 @@ def random_vector(length: float = 1) -> glm.vec2:
     return glm.rotate(v, angle)
 
 
-def xpath(dict_: dict, path: str, early=False):
-    """Return the value in dict_ described by path (separated by `.`)"""
+# path -> tuple of interned keys, see `compile_path`
+_paths = {}
+
+
+def compile_path(path: str) -> tuple[str, ...]:
+    """Split path (separated by `.`) into its keys, once per path.
+
+    The result is stored in a table, so repeated calls are a single dict
+    lookup.  Paths are expected to come from code and asset manifests, the
+    table is never purged.
 
+    """
+
+    try:
+        return _paths[path]
+    except KeyError:
+        pass
+
+    keys = tuple(sys.intern(k) for k in path.split('.'))
+    _paths[sys.intern(path)] = keys
+    return keys
+
+
+def _walk(keys: tuple[str, ...], early: bool, dict_: dict):
     res = dict_
-    for k in path.split('.'):
+    for k in keys:
         try:
             res = res[k]
         except TypeError, KeyError:
@@ -58,3 +83,27 @@ def xpath(dict_: dict, path: str, early=False):
             raise
 
     return res
+
+
+def xpath(dict_: dict, path: str, early=False):
+    """Return the value in dict_ described by path (separated by `.`)"""
+
+    return _walk(compile_path(path), early, dict_)
+
+
+def accessor(path: str, early=False) -> Callable[[dict], object]:
+    """Return a function doing `xpath(dict_, path, early)`.
+
+    The path is only parsed once, use this for lookups in a hot loop:
+
+        get_speed = accessor('ship.engine.speed')
+        for config in configs:
+            speed = get_speed(config)
+
+    """
+
+    keys = compile_path(path)
+    if len(keys) == 1 and not early:
+        return itemgetter(keys[0])
+
+    return partial(_walk, keys, early)
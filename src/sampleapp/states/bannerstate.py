@@ -13,6 +13,8 @@ import sampleapp.globals as G
 
 
 class BannerState(GameState):
+    event_types = (pygame.QUIT, pygame.KEYDOWN)
+
     def __init__(self, app, banner, styles, pos, *args, blink=0,
                  followup=0, lifetime=None, **kwargs):
         super().__init__(app)
@@ -25,14 +27,21 @@ class BannerState(GameState):
             text=TGroup(),
         )
 
+        # The textbox surface that was drawn last, see needs_redraw
+        self.drawn = None
+
         rsap = RSAP(pos=pos)
         self.textbox = TextBox(self.banner, styles, blink=blink)
         self.groups.text.add(cs.TextSprite(self.app.renderer, self.textbox, rsap))
 
     def reset(self, *args, **kwargs):
+        self.drawn = None
         if self.lifetime is not None:
             self.lifetime.reset()
 
+    def needs_redraw(self):
+        return self.textbox() is not self.drawn
+
     def update(self, dt):
         if self.lifetime is not None and self.lifetime.cold():
             raise StateExit(self.followup)
@@ -42,6 +51,7 @@ class BannerState(GameState):
         self.app.renderer.draw_color = G.COLOR.background
         self.app.renderer.clear()
         self.groups.text.draw()
+        self.drawn = self.textbox()
 
     def dispatch_event(self, e):
         if e.type == pygame.KEYDOWN:
@@ -80,6 +80,8 @@ class Game(GameState):
         LINGERING = 5
         FINISHED = 6
 
+    event_types = (pygame.QUIT, pygame.KEYDOWN)
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.state = None
@@ -0,0 +1,33 @@
+import pygame
+import pytest
+
+from ddframework.app import App
+from ddframework.msgbroker import broker
+from ddframework.profiler import profiler
+
+
+@pytest.fixture(autouse=True)
+def restore_globals():
+    """Undo what an App leaves in the global profiler, broker and SDL."""
+    yield
+
+    profiler.reset()
+    profiler.enabled = True
+    profiler.budget = None
+    broker.wakeup = None
+    if pygame.display.get_init():
+        pygame.event.set_allowed(None)
+
+
+@pytest.fixture
+def make_app():
+    def make(**kwargs):
+        kwargs = dict(resolution=(320, 240), fps=60, bgcolor='black', headless=True) | kwargs
+        return App('test', **kwargs)
+
+    return make
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
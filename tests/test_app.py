@@ -0,0 +1,275 @@
+import asyncio
+import json
+import os
+import threading
+import time
+
+import pygame
+import pytest
+
+from ddframework.app import GameState, StackPermissions, StateExit
+
+SDL_VIDEODRIVER = os.environ.get('SDL_VIDEODRIVER')
+
+
+class Counter(GameState):
+    def __init__(self, app):
+        super().__init__(app)
+        self.updates = []
+        self.draws = 0
+
+    def update(self, dt):
+        self.updates.append(dt)
+
+    def draw(self):
+        self.draws += 1
+
+
+@pytest.fixture
+def fixed_app(make_app):
+    return make_app(tick_rate=50, max_steps=3)
+
+
+def test_fixed_update_accumulates(fixed_app):
+    app = fixed_app
+    state = Counter(app)
+    app.push(state)
+
+    app.fixed_update(0.01)
+    assert state.updates == []
+    assert app.alpha == pytest.approx(0.5)
+
+    app.fixed_update(0.035)
+    assert state.updates == [0.02, 0.02]
+    assert app.alpha == pytest.approx(0.25)
+
+
+def test_fixed_update_max_steps(fixed_app):
+    app = fixed_app
+    state = Counter(app)
+    app.push(state)
+
+    app.fixed_update(1.0)
+    assert len(state.updates) == 3
+    assert app.alpha == 0
+
+
+def test_benchmark_report(app, tmp_path):
+    state = Counter(app)
+
+    report = tmp_path / 'bench.json'
+    result = app.benchmark(state, 10, dt=0.01, report=report)
+
+    assert result['frames'] == 10
+    assert state.updates == [0.01] * 10
+    assert state.draws == 10
+    for key in ('events', 'update', 'draw', 'cls', 'total'):
+        assert key in result['stats']
+    assert result['stats']['draw']['count'] == 10
+    assert json.loads(report.read_text()) == result
+
+
+def test_benchmark_is_repeatable(app):
+    app.benchmark(Counter(app), 10)
+    result = app.benchmark(Counter(app), 10)
+    assert result['stats']['draw']['count'] == 10
+
+
+def test_profile_settings_apply_only_while_running(app, make_app):
+    enabled, budget = app.profiler.enabled, app.profiler.budget
+
+    other = make_app(fps=30, profile=False)
+    assert (app.profiler.enabled, app.profiler.budget) == (enabled, budget)
+
+    result = other.benchmark(Counter(other), 3)
+    assert 'draw' not in result['stats']
+    assert (app.profiler.enabled, app.profiler.budget) == (enabled, budget)
+
+
+def test_benchmark_restores_stack(app):
+    app.benchmark(Counter(app), 3)
+    app.benchmark(Counter(app), 3)
+    assert app.state_stack == []
+
+
+def test_headless_leaves_environment_alone(app):
+    assert os.environ.get('SDL_VIDEODRIVER') == SDL_VIDEODRIVER
+    assert pygame.display.get_driver() == 'dummy'
+
+
+def test_plan_follows_stack(app):
+    bottom = Counter(app)
+    middle = Counter(app)
+    top = Counter(app)
+
+    app.push(bottom)
+    app.push(middle, StackPermissions.DRAW)
+    assert app.plan(StackPermissions.DRAW) == (bottom, middle)
+    assert app.plan(StackPermissions.UPDATE) == (middle, )
+
+    app.push(top, StackPermissions.UPDATE)
+    assert app.plan(StackPermissions.DRAW) == (bottom, top)
+    assert app.plan(StackPermissions.UPDATE) == (middle, top)
+
+    app.transition(-1)
+    assert app.plan(StackPermissions.DRAW) == (bottom, middle)
+    assert app.plan(StackPermissions.UPDATE) == (middle, )
+
+
+class KeyCounter(Counter):
+    event_types = (pygame.KEYDOWN, )
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.events = []
+
+    def dispatch_event(self, e):
+        self.events.append(e.type)
+
+
+def test_event_routing(app):
+    everything = Counter(app)
+    keys = KeyCounter(app)
+
+    app.push(keys)
+    app.push(everything, StackPermissions.EVENTS)
+    assert app.route(pygame.KEYDOWN) == (keys, everything)
+    assert app.route(pygame.MOUSEMOTION) == (everything, )
+
+
+def test_event_filter(app):
+    app.push(KeyCounter(app))
+    app.update_event_filter()
+    assert pygame.event.get_blocked(pygame.MOUSEMOTION)
+    assert not pygame.event.get_blocked(pygame.KEYDOWN)
+
+    app.push(Counter(app), StackPermissions.EVENTS)
+    app.update_event_filter()
+    assert not pygame.event.get_blocked(pygame.MOUSEMOTION)
+
+
+def test_quit_always_reaches_the_top_state(app):
+    keys = KeyCounter(app)
+    app.push(keys)
+    app.update_event_filter()
+    assert not pygame.event.get_blocked(pygame.QUIT)
+    assert app.route(pygame.QUIT) == (keys, )
+
+
+def test_event_filter_is_restored(app):
+    app.push(KeyCounter(app))
+    app.benchmark(KeyCounter(app), 3)
+    assert not pygame.event.get_blocked(pygame.MOUSEMOTION)
+    assert not pygame.event.get_blocked(pygame.QUIT)
+
+
+def test_transform_arrays(app):
+    points = [(0, 0), (10, 20), (-3, 7.5)]
+
+    converted = app.coordinates_to_window_array(points)
+    assert [tuple(p) for p in converted] == [app.coordinates_to_window(p) for p in points]
+
+    converted = app.size_from_window_array(points)
+    assert [tuple(p) for p in converted] == [app.size_from_window(p) for p in points]
+
+    assert len(app.coordinates_from_window_array([])) == 0
+
+
+def test_transform_follows_resize(make_app):
+    app = make_app(resolution=(64, 48))
+    assert app.size_to_window((1, 1)) == (1, 1)
+
+    app.window.size = (128, 96)
+    app.push(Counter(app))
+    app.dispatch_events()
+
+    assert app.size_to_window((1, 1)) == (2, 2)
+    assert tuple(app.coordinates_from_window_array([(128, 96)])[0]) == (64, 48)
+
+
+class Static(Counter):
+    def needs_redraw(self):
+        return False
+
+
+def test_idle_frames(app):
+    state = Static(app)
+    app.push(state)
+
+    app.frame(0.01)
+    assert state.draws == 1
+    assert not app.idle
+
+    app.frame(0.01)
+    app.frame(0.01)
+    assert state.draws == 1
+    assert len(state.updates) == 3
+    assert app.idle
+
+    app.push(Counter(app), StackPermissions.DRAW)
+    app.frame(0.01)
+    app.frame(0.01)
+    assert state.draws == 3
+    assert not app.idle
+
+
+def test_wait_keeps_event(app):
+    state = KeyCounter(app)
+    app.push(state)
+    app.dispatch_events()
+
+    pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_a))
+    app.wait(0.1)
+    app.dispatch_events()
+    assert state.events == [pygame.KEYDOWN]
+
+
+def test_post_wakes_up_wait(app):
+    state = KeyCounter(app)
+    app.push(state)
+    app.dispatch_events()
+
+    received = []
+    sub = app.broker.register(received.append, 'test_wakeup')
+    threading.Timer(0.05, app.broker.post, ('test_wakeup', 42)).start()
+
+    t0 = time.perf_counter()
+    app.wait(5)
+    assert time.perf_counter() - t0 < 1
+
+    app.dispatch_events()
+    sub.unregister()
+
+    assert received == [42]
+    assert state.events == []
+
+
+class Loading(Counter):
+    def reset(self, *args, **kwargs):
+        self.result = None
+        self.app.spawn(self.load())
+
+    async def load(self):
+        waiter = self.app.broker.wait_for('test_loaded')
+        self.app.spawn(self.read())
+        msg = await waiter
+        self.result = msg.args[0]
+
+    async def read(self):
+        await asyncio.sleep(0.05)
+        self.app.broker.send('test_loaded', 'data')
+
+    def update(self, dt):
+        super().update(dt)
+        if self.result is not None:
+            raise StateExit(None)
+
+
+def test_run_async(app):
+    state = Loading(app)
+    asyncio.run(app.run_async(state))
+
+    assert state.result == 'data'
+    # Frames kept running while the coroutines waited
+    assert len(state.updates) > 2
+    assert not app.tasks
@@ -0,0 +1,208 @@
+import gc
+import weakref
+
+import pygame
+import pytest
+
+from ddframework.cache import Cache, TextureCache, sizeof
+
+
+def surface(w=10, h=10):
+    return pygame.Surface((w, h), depth=32)
+
+
+def test_sizeof():
+    assert sizeof(surface(10, 20)) == 800
+    assert sizeof('not a texture') == 0
+
+
+def test_evicts_least_recently_used():
+    textures = TextureCache(1000)
+    textures['a'] = surface()
+    textures['b'] = surface()
+    assert textures.bytes == 800
+
+    textures['a']
+    textures['c'] = surface()
+
+    assert set(textures) == {'a', 'c'}
+    assert textures.bytes == 800
+    assert textures.evictions == 1
+
+    with pytest.raises(KeyError):
+        textures['b']
+
+
+def test_pinned_entries_stay():
+    textures = TextureCache(900)
+    textures['a'] = surface()
+    textures.pin('a')
+    textures['b'] = surface()
+    textures['c'] = surface()
+
+    assert set(textures) == {'a', 'c'}
+
+    textures.unpin('a')
+    textures['d'] = surface()
+    assert set(textures) == {'c', 'd'}
+
+
+def test_reload_on_miss():
+    loaded = []
+
+    def reload(key):
+        loaded.append(key)
+        return surface()
+
+    textures = TextureCache(500, reload=reload)
+    textures['a'] = surface()
+    textures['b'] = surface()
+
+    assert 'a' in textures.evicted
+    assert sizeof(textures['a']) == 400
+    assert loaded == ['a']
+
+    report = textures.report()
+    assert report['entries'] == 1
+    assert report['bytes'] == 400
+    assert report['reloads'] == 1
+    assert report['evictions'] == 2
+
+
+def test_mounted_in_cache_tree():
+    tree = Cache()
+    tree['textures'] = TextureCache(1000)
+    tree.set_xpath('textures.ship', surface())
+
+    assert tree.xpath('textures.ship').get_size() == (10, 10)
+    assert tree['textures'].bytes == 400
+
+
+def test_xpath_memo_invalidated_on_write():
+    tree = Cache()
+    tree.set_xpath('ships.player.speed', 1)
+    assert tree.xpath('ships.player.speed') == 1
+    assert 'ships.player.speed' in tree._memo
+
+    tree['ships']['player']['speed'] = 2
+    assert tree.xpath('ships.player.speed') == 2
+
+    del tree['ships']
+    with pytest.raises(KeyError):
+        tree.xpath('ships.player.speed')
+
+
+def test_xpath_memo_drops_written_values():
+    tree = Cache()
+    tree.set_xpath('textures.ship', surface())
+    tree.xpath('textures.ship')
+    tree.xpath('textures', early=True)
+    ship = weakref.ref(tree['textures']['ship'])
+
+    del tree['textures']['ship']
+    assert 'textures.ship' not in tree._memo
+    assert 'textures' in tree._memo_early
+
+    gc.collect()
+    assert ship() is None
+
+
+def test_xpath_early_and_accessor():
+    tree = Cache()
+    tree.set_xpath('a.b', 'leaf')
+
+    get = tree.accessor('a.b.c', early=True)
+    assert get() == 'leaf'
+    assert get() == 'leaf'
+
+    tree.set_xpath('a.b', {'c': 'deeper'})
+    assert get() == 'deeper'
+
+
+def test_xpath_not_memoized_through_texture_cache():
+    tree = Cache()
+    tree['textures'] = TextureCache(1000)
+    tree.set_xpath('textures.a', surface())
+    tree.set_xpath('textures.b', surface())
+
+    tree.xpath('textures.a')
+    tree.xpath('textures.a')
+    assert tree['textures'].hits == 2
+    assert not tree._memo
+
+    tree.set_xpath('textures.c', surface())
+    assert set(tree['textures']) == {'a', 'c'}
+
+
+def test_get_and_contains_reload():
+    textures = TextureCache(500, reload=lambda key: surface())
+    textures['a'] = surface()
+    textures['b'] = surface()
+
+    assert 'a' in textures
+    assert 'x' not in textures
+    assert textures.get('a') is not None
+    assert textures.reloads == 1
+    assert textures.get('x', 'default') is not None
+
+    plain = TextureCache(500)
+    plain['a'] = surface()
+    plain['b'] = surface()
+    assert 'a' not in plain
+    assert plain.get('a', 'default') == 'default'
+
+
+def test_oversized_entry_is_refused():
+    textures = TextureCache(500)
+    textures['a'] = surface()
+
+    with pytest.raises(ValueError):
+        textures['big'] = surface(20, 20)
+
+    assert set(textures) == {'a'}
+    assert textures.bytes == 400
+
+
+def test_xpath_memo_survives_unrelated_writes():
+    tree = Cache()
+    tree.set_xpath('ships.player.speed', 1)
+    tree.set_xpath('score.value', 0)
+
+    tree.xpath('ships.player.speed')
+    entry = tree._memo['ships.player.speed']
+
+    for i in range(10):
+        tree['score']['value'] = i
+        assert tree.xpath('ships.player.speed') == 1
+
+    assert tree._memo['ships.player.speed'] is entry
+
+
+def test_copy_has_its_own_memo():
+    a = Cache()
+    a['x'] = 1
+    a.xpath('x')
+
+    b = a.copy()
+    b['x'] = 2
+    assert b.xpath('x') == 2
+    assert a.xpath('x') == 1
+    with pytest.raises(KeyError):
+        a.xpath('y')
+    assert b.xpath('x') == 2
+    assert b['x'] == 2
+
+
+def test_texture_cache_copy():
+    textures = TextureCache(1000)
+    textures['a'] = surface()
+    textures.pin('a')
+
+    other = textures.copy()
+    other['b'] = surface()
+    other.unpin('a')
+
+    assert set(textures) == {'a'}
+    assert textures.pinned == {'a'}
+    assert textures.bytes == 400
+    assert other.bytes == 800
@@ -0,0 +1,86 @@
+import pygame
+import pygame._sdl2 as sdl2
+import pytest
+
+from time import sleep
+
+from ddframework.app import StateExit
+from ddframework.cache import Cache
+from ddframework.loader import Loader, font, surface
+
+
+def make_surface(size, color):
+    image = pygame.Surface((size, size))
+    image.fill(color)
+    return image
+
+
+def test_loader(app):
+    pygame.font.init()
+    cache = Cache()
+    manifest = {
+        'textures.red': surface(make_surface, 8, 'red'),
+        'surfaces.blue': surface(make_surface, 4, 'blue', texture=False),
+        'fonts.default': font(None, 12),
+    }
+    loader = Loader(app, manifest, cache=cache, followup=1)
+    loader.reset()
+
+    with pytest.raises(StateExit) as e:
+        for _ in range(100):
+            loader.update(0)
+            loader.draw()
+            sleep(0.01)
+
+    assert e.value.args == (1, )
+    assert loader.progress == 1.0
+    assert isinstance(cache.xpath('textures.red'), sdl2.Texture)
+    assert isinstance(cache.xpath('surfaces.blue'), pygame.Surface)
+    assert isinstance(cache.xpath('fonts.default'), pygame.Font)
+
+
+def test_loader_error(app):
+    def broken():
+        raise FileNotFoundError('missing.png')
+
+    loader = Loader(app, {'broken': surface(broken)}, cache=Cache())
+    loader.reset()
+    sleep(0.1)
+
+    with pytest.raises(FileNotFoundError):
+        loader.update(0)
+    assert loader._executor is None
+
+
+def test_loader_reset_replaces_executor(app):
+    loader = Loader(app, {'slow': surface(sleep, 0.05, texture=False)}, cache=Cache())
+    loader.reset()
+    first = loader._executor
+
+    loader.reset()
+    with pytest.raises(RuntimeError):
+        first.submit(print)
+    assert loader._executor is not first
+    loader.shutdown()
+
+
+def test_loader_zero_budget_progresses(app):
+    loader = Loader(app, {'a': surface(make_surface, 4, 'red', texture=False),
+                          'b': surface(make_surface, 4, 'blue', texture=False)},
+                    cache=Cache(), budget=0)
+    loader.reset()
+    sleep(0.1)
+
+    loader.update(0)
+    assert loader.done == 1
+    with pytest.raises(StateExit):
+        loader.update(0)
+
+
+def test_loader_escape_shuts_down(app):
+    loader = Loader(app, {'slow': surface(sleep, 0.05, texture=False)}, cache=Cache())
+    loader.reset()
+
+    with pytest.raises(StateExit):
+        loader.dispatch_event(pygame.event.Event(pygame.QUIT))
+    assert loader._executor is None
@@ -0,0 +1,48 @@
+import math
+
+import pygame
+import pygame._sdl2 as sdl2
+
+from ddframework.memory import MemoryTracker
+
+
+def test_stage_delta():
+    tracker = MemoryTracker()
+    tracker.start()
+
+    with tracker.stage('update'):
+        junk = [object() for _ in range(1000)]
+
+    tracker.stop()
+    assert tracker.stats['mem.update'].latest > 1000 * 16
+    assert math.isnan(tracker.stats['mem.update'].p50)
+    assert junk
+
+
+def test_sprite_counts():
+    tracker = MemoryTracker()
+    group = pygame.sprite.Group()
+    tracker.watch('particles', group)
+
+    tracker.frame()
+    group.add(pygame.sprite.Sprite(), pygame.sprite.Sprite())
+    tracker.frame()
+
+    stat = tracker.stats['sprites.particles']
+    assert (stat.min, stat.max, stat.latest) == (0, 2, 2)
+
+
+def test_texture_scan():
+    window = pygame.Window(size=(16, 16))
+    renderer = sdl2.Renderer(window)
+
+    tracker = MemoryTracker()
+    tracker.scan_textures()
+    before = tracker.stats['textures'].latest
+
+    textures = [sdl2.Texture.from_surface(renderer, pygame.Surface((8, 4))) for _ in range(3)]
+    tracker.scan_textures()
+
+    assert tracker.stats['textures'].latest == before + 3
+    assert tracker.stats['texture_bytes'].latest >= 3 * 8 * 4 * 4
+    assert textures
@@ -0,0 +1,347 @@
+import gc
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from ddframework.msgbroker import Message, MessageBroker, Priority, UnknownMessageType
+
+
+def test_send_during_tick_is_deferred():
+    broker = MessageBroker()
+    received = []
+
+    def on_ping(n):
+        received.append(n)
+        if n < 3:
+            broker.send('ping', n + 1)
+
+    broker.register(on_ping, 'ping')
+    broker.send('ping', 0)
+
+    broker.tick()
+    assert received == [0]
+    assert len(broker) == 1
+
+    broker.tick()
+    broker.tick()
+    broker.tick()
+    assert received == [0, 1, 2, 3]
+    assert len(broker) == 0
+
+
+def test_wants_command():
+    broker = MessageBroker()
+    received = []
+    broker.register(lambda *args, **kwargs: received.append((args, kwargs)), 'a', 'b', wants_command=True)
+
+    broker.send('a', 1, x=2)
+    broker.send('b')
+    broker.tick()
+
+    assert received == [(('a', 1), {'x': 2}), (('b', ), {})]
+
+
+def test_max_messages_carries_over_in_order():
+    broker = MessageBroker(max_messages=2)
+    received = []
+    broker.register(received.append, 'n')
+
+    for i in range(5):
+        broker.send('n', i)
+
+    broker.tick()
+    assert received == [0, 1]
+    assert (broker.dispatched, broker.carried) == (2, 3)
+
+    broker.send('n', 5)
+    broker.tick()
+    broker.tick()
+    assert received == [0, 1, 2, 3, 4, 5]
+    assert (broker.dispatched, broker.carried) == (2, 0)
+    assert broker.max_carried == 3
+
+
+def test_time_budget_dispatches_at_least_one():
+    broker = MessageBroker(time_budget=0)
+    received = []
+    broker.register(received.append, 'n')
+
+    broker.send('n', 1)
+    broker.send('n', 2)
+
+    broker.tick()
+    assert received == [1]
+    assert broker.carried == 1
+
+
+def test_unknown_message_keeps_the_rest():
+    broker = MessageBroker()
+    received = []
+    broker.register(received.append, 'n')
+
+    broker.send('n', 1)
+    broker.send('nope')
+    broker.send('n', 2)
+
+    with pytest.raises(UnknownMessageType):
+        broker.tick()
+    assert received == [1]
+
+    broker.tick()
+    assert received == [1, 2]
+
+
+def test_coalesce_latest_wins_in_place():
+    broker = MessageBroker()
+    received = []
+    broker.register(lambda *args: received.append(args), 'score', 'other', wants_command=True)
+    broker.set_policy('score', coalesce=True)
+
+    broker.send('score', 1)
+    broker.send('other')
+    broker.send('score', 2)
+    broker.send('score', 3)
+    broker.tick()
+
+    assert received == [('score', 3), ('other', )]
+    assert broker.coalesced == 2
+
+
+def test_coalesce_merge_and_key():
+    broker = MessageBroker()
+    received = []
+
+    def merge(old, new):
+        return Message(new.message, (new.args[0], old.args[1] + new.args[1]), {})
+
+    broker.register(lambda *args: received.append(args), 'damage',
+                    coalesce=merge, key=lambda target, amount: target)
+
+    broker.send('damage', 'ship', 1)
+    broker.send('damage', 'boss', 5)
+    broker.send('damage', 'ship', 2)
+    broker.tick()
+    assert received == [('ship', 3), ('boss', 5)]
+
+    # A new tick starts a new slot
+    broker.send('damage', 'ship', 4)
+    broker.tick()
+    assert received[-1] == ('ship', 4)
+
+
+def test_register_key_alone_sets_policy():
+    broker = MessageBroker()
+    received = []
+    broker.set_policy('damage', coalesce=True)
+    broker.register(lambda *args: received.append(args), 'damage', key=lambda target: target)
+
+    broker.send('damage', 'ship')
+    broker.send('damage', 'boss')
+    broker.send('damage', 'ship')
+    broker.tick()
+    assert received == [('ship', ), ('boss', )]
+
+
+def test_priority_order_and_carry():
+    broker = MessageBroker(max_messages=2)
+    received = []
+    broker.register(received.append, 'low', priority=Priority.LOW)
+    broker.register(received.append, 'normal')
+    broker.register(received.append, 'high', priority=Priority.HIGH)
+
+    broker.send('low', 'l1')
+    broker.send('normal', 'n1')
+    broker.send('high', 'h1')
+    broker.send('normal', 'n2')
+    broker.tick()
+    assert received == ['h1', 'n1']
+
+    broker.send('high', 'h2')
+    broker.tick()
+    assert received == ['h1', 'n1', 'h2', 'n2']
+
+    broker.tick()
+    assert received[-1] == 'l1'
+
+
+def test_dispatch_in_registration_order():
+    broker = MessageBroker()
+    received = []
+    for i in range(10):
+        broker.register(lambda i=i: received.append(i), 'n')
+
+    broker.send('n')
+    broker.tick()
+    assert received == list(range(10))
+
+
+def test_unregister():
+    broker = MessageBroker()
+    received = []
+    sub = broker.register(received.append, 'a', 'b')
+    broker.register(lambda x: received.append(-x), 'a')
+
+    sub.unregister()
+    broker.send('a', 1)
+    broker.send('b', 2)
+    broker.tick()
+
+    assert received == [-1]
+
+
+def test_weak_receiver():
+    broker = MessageBroker()
+    received = []
+
+    class State:
+        def on_msg(self, x):
+            received.append(x)
+
+    state = State()
+    sub = broker.register(state.on_msg, 'msg', weak=True)
+    assert sub.alive
+
+    broker.send('msg', 1)
+    broker.tick()
+    assert received == [1]
+
+    del state
+    gc.collect()
+    assert not sub.alive
+    assert broker._receivers['msg'] == ()
+
+    broker.send('msg', 2)
+    broker.tick()
+    assert received == [1]
+
+
+def test_unregister_during_tick():
+    broker = MessageBroker()
+    received = []
+
+    def first(x):
+        received.append(('first', x))
+        sub.unregister()
+
+    broker.register(first, 'n')
+    sub = broker.register(lambda x: received.append(('second', x)), 'n')
+
+    broker.send('n', 1)
+    broker.send('n', 2)
+    broker.tick()
+
+    # The table is swapped, not mutated, so the running dispatch is complete
+    assert received == [('first', 1), ('second', 1), ('first', 2)]
+
+
+def test_post_from_threads():
+    broker = MessageBroker()
+    received = []
+    wakeups = []
+    broker.register(received.append, 'n')
+    broker.wakeup = lambda: wakeups.append(1)
+
+    threads = [threading.Thread(target=lambda i=i: [broker.post('n', i * 100 + j) for j in range(100)])
+               for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(wakeups) == 1
+    assert len(broker) == 400
+
+    broker.tick()
+    assert sorted(received) == list(range(400))
+
+    broker.post('n', 0)
+    assert len(wakeups) == 2
+
+
+def test_post_when_done():
+    broker = MessageBroker()
+    received = []
+    broker.register(lambda future, tag: received.append((future.result(), tag)), 'done')
+
+    with ThreadPoolExecutor() as executor:
+        broker.post_when_done(executor.submit(sum, (1, 2, 3)), 'done', 'sum')
+
+    broker.tick()
+    assert received == [(6, 'sum')]
+
+
+def test_instrument():
+    broker = MessageBroker()
+    stats = broker.instrument(slow_handler=0.01)
+
+    def fast(x):
+        pass
+
+    def slow(x):
+        time.sleep(0.02)
+
+    broker.register(fast, 'a')
+    slow_sub = broker.register(slow, 'a')
+    broker.register(fast, 'b', coalesce=True)
+
+    broker.send('a', 1)
+    broker.send('a', 2)
+    broker.send('b', 1)
+    broker.send('b', 2)
+    broker.tick()
+
+    assert stats['broker.a.sent'].latest == 2
+    assert stats['broker.a.dispatched'].latest == 2
+    assert stats['broker.b.sent'].latest == 2
+    assert stats['broker.b.dispatched'].latest == 1
+    assert stats['broker.a.sent'].p50 == pytest.approx(2, rel=0.03)
+    assert stats['broker.a.latency'].max > 0.02
+    slow_key = f'broker.a.test_instrument.<locals>.slow#{slow_sub.id}'
+    assert stats[slow_key].min >= 0.02
+    assert broker.slow_handlers == {slow_key: 2}
+
+    broker.uninstrument()
+    broker.send('a', 3)
+    broker.tick()
+    assert stats['broker.a.sent'].latest == 2
+
+
+def test_instrumented_messages_keep_their_shape():
+    broker = MessageBroker()
+    broker.instrument()
+    received = []
+
+    def merge(old, new):
+        message, args, kwargs = new
+        return Message(message, (old.args[0] + args[0], ), kwargs)
+
+    broker.register(lambda *args: received.append(args), 'n', coalesce=merge)
+    broker.send('n', 1)
+    broker.send('n', 2)
+    broker.tick()
+
+    assert received == [(3, )]
+    assert broker.stats['broker.n.latency'].latest > 0
+
+
+def test_instrument_keeps_receivers_apart():
+    broker = MessageBroker()
+    stats = broker.instrument()
+
+    class State:
+        def on_msg(self):
+            pass
+
+    a = broker.register(State().on_msg, 'msg')
+    b = broker.register(State().on_msg, 'msg')
+    broker.send('msg')
+    broker.tick()
+
+    assert a.id != b.id
+    key = 'broker.msg.test_instrument_keeps_receivers_apart.<locals>.State.on_msg'
+    report = stats.report()
+    assert report[f'{key}#{a.id}']['count'] == 1
+    assert report[f'{key}#{b.id}']['count'] == 1
@@ -0,0 +1,83 @@
+import pygame
+
+from ddframework.app import GameState, StackPermissions, StateExit
+from ddframework.overlay import PerfOverlay
+from ddframework.statemachine import StateMachine
+
+
+class Idle(GameState):
+    def update(self, dt):
+        pass
+
+    def draw(self):
+        pass
+
+
+def test_overlay_caches_glyphs(app):
+    overlay = PerfOverlay(app)
+    app.push(Idle(app))
+    app.push(overlay, StackPermissions.ALL)
+    overlay.text.draw('0123456789.', (0, 0))
+
+    for _ in range(5):
+        with app.profiler.profile('frame'):
+            app.frame(1 / 60)
+    glyphs = len(overlay.text.glyphs)
+
+    for _ in range(5):
+        with app.profiler.profile('frame'):
+            app.frame(1 / 60)
+
+    assert len(overlay.history) == 10
+    assert len(overlay.text.glyphs) == glyphs
+    assert app.profiler['PerfOverlay.frame'].latest > 0
+    assert app.profiler.report()['PerfOverlay.frame']['count'] == 10
+
+
+def test_overlay_samples_once_per_frame(make_app):
+    app = make_app(tick_rate=240, max_steps=8)
+    overlay = PerfOverlay(app)
+    app.push(Idle(app))
+    app.push(overlay, StackPermissions.ALL)
+
+    for _ in range(3):
+        app.frame(1 / 30)
+
+    assert len(overlay.history) == 3
+
+
+def test_overlay_toggle(app):
+    app.push(Idle(app))
+    app.push(PerfOverlay(app), StackPermissions.ALL)
+
+    pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_F3))
+    app.frame(1 / 60)
+    assert len(app.state_stack) == 1
+
+
+class Leaving(Idle):
+    def update(self, dt):
+        raise StateExit(0)
+
+
+def test_exit_under_overlay_transitions_the_game(app):
+    first, second = Leaving(app), Idle(app)
+    sm = StateMachine()
+    sm.add(first, second)
+    sm.add(second, None)
+
+    overlay = PerfOverlay(app)
+    app.push(sm.walker())
+    app.push(overlay, StackPermissions.ALL)
+
+    app.frame(1 / 60)
+    assert [entry.state for entry in app.state_stack] == [second, overlay]
+
+
+def test_game_ending_under_overlay_pops_both(app):
+    app.push(Idle(app))
+    app.push(PerfOverlay(app), StackPermissions.ALL)
+
+    pygame.event.post(pygame.event.Event(pygame.QUIT))
+    app.frame(1 / 60)
+    assert app.state_stack == []
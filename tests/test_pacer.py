@@ -0,0 +1,77 @@
+import pytest
+
+from ddframework.pacer import FramePacer
+
+
+class FakeClock:
+    """Time only advances by sleeping, and by a tick per reading."""
+
+    def __init__(self, resolution=0.0001):
+        self.now = 0.0
+        self.resolution = resolution
+
+    def __call__(self):
+        self.now += self.resolution
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def fake_pacer(**kwargs):
+    clock = FakeClock()
+    return FramePacer(clock=clock, sleep=clock.sleep, **kwargs), clock
+
+
+def test_pacer_frame_time() -> None:
+    pacer, clock = fake_pacer()
+    assert pacer.tick(100) == 0
+
+    # Deadlines are absolute, so single late frames don't add up
+    dts = []
+    for i in range(10):
+        if i == 3:
+            clock.sleep(0.015)
+        dts.append(pacer.tick(100))
+
+    assert sum(dts) == pytest.approx(0.1, abs=0.0002)
+    assert max(dts) > 0.014
+    assert pacer.get_fps() == pytest.approx(100, rel=0.01)
+
+
+def test_pacer_skip_draw() -> None:
+    pacer, clock = fake_pacer(max_skips=2)
+    pacer.tick(100)
+
+    clock.sleep(0.1)
+    pacer.tick(100)
+    assert pacer.miss > 0.01
+    assert pacer.skip_draw
+
+    pacer.tick(100)
+    assert pacer.skip_draw
+
+    pacer.tick(100)
+    assert not pacer.skip_draw
+
+    pacer.tick(100)
+    assert not pacer.skip_draw
+    assert pacer.miss < 0.001
+
+
+def test_pacer_uncapped() -> None:
+    pacer, clock = fake_pacer()
+    pacer.tick(0)
+    clock.sleep(0.02)
+    assert pacer.tick(0) >= 0.02
+    assert pacer.miss == 0
+
+
+def test_pacer_resync() -> None:
+    pacer, clock = fake_pacer()
+    pacer.tick(100)
+
+    clock.sleep(1)
+    pacer.resync()
+    assert pacer.tick(100) == pytest.approx(1.01, abs=0.001)
+    assert not pacer.skip_draw
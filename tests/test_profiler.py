@@ -0,0 +1,211 @@
+import json
+import math
+
+import pytest
+
+from time import sleep
+
+from ddframework.profiler import Accumulator, Histogram, Profiled, Profiler, profiled
+from ddframework.profiler import profiler as global_profiler
+
+
+def test_histogram_percentiles():
+    histogram = Histogram()
+    for i in range(1, 1001):
+        histogram.add(i / 1000)
+
+    assert histogram.count == 1000
+    assert histogram.percentile(50) == pytest.approx(0.5, rel=0.03)
+    assert histogram.percentile(90) == pytest.approx(0.9, rel=0.03)
+    assert histogram.percentile(99) == pytest.approx(0.99, rel=0.03)
+    assert histogram.percentile(99.9) == pytest.approx(0.999, rel=0.03)
+
+
+def test_histogram_empty_and_out_of_range():
+    histogram = Histogram()
+    assert histogram.percentile(50) == 0
+
+    histogram.add(0)
+    histogram.add(1e6)
+    assert histogram.percentile(0) < 1e-5
+    assert histogram.percentile(100) > 1
+
+
+def test_profiler_histogram_ranges():
+    profiler = Profiler(histogram=None)
+    profiler.set_histogram('count', (1, 32))
+    for value in (-100, 5, 1000):
+        profiler.accumulate('delta', value)
+        profiler.accumulate('count', value + 100)
+
+    assert math.isnan(profiler['delta'].p50)
+    assert profiler.report()['delta']['p50'] is None
+    assert profiler['count'].p50 == pytest.approx(105, rel=0.03)
+    assert profiler['count'].p999 == pytest.approx(1100, rel=0.03)
+
+    profiler.reset()
+    profiler.accumulate('count', 20)
+    assert profiler['count'].p50 == pytest.approx(20, rel=0.03)
+
+
+def test_profiler_percentiles_and_budget():
+    profiler = Profiler(budget=1 / 60, budget_keys={'draw'})
+    for _ in range(98):
+        profiler.accumulate('draw', 0.005)
+    profiler.accumulate('draw', 0.05)
+    profiler.accumulate('draw', 0.1)
+
+    stat = profiler['draw']
+    assert stat.p50 == pytest.approx(0.005, rel=0.03)
+    assert stat.p99 == pytest.approx(0.05, rel=0.03)
+    assert stat.p999 == pytest.approx(0.1, rel=0.03)
+    assert stat.over_budget == 2
+    assert profiler.report()['draw']['over_budget'] == 2
+
+
+def test_profiler_budget_keys():
+    profiler = Profiler(budget=1 / 60)
+    profiler.accumulate('frame', 0.02)
+    profiler.accumulate('total', 10)
+    profiler.accumulate('broker.score.sent', 3)
+
+    assert profiler['frame'].over_budget == 1
+    assert profiler['total'].over_budget == 0
+    assert profiler['broker.score.sent'].over_budget == 0
+
+
+def test_accumulator_window():
+    acc = Accumulator(4)
+    assert (acc.avg, acc.min, acc.max) == (0, 0, 0)
+
+    values = [5, 1, 3, 8, 2, 7, 4, 4, 9, 0]
+    for i, value in enumerate(values):
+        acc.add(value)
+        window = values[max(0, i - 3):i + 1]
+        assert acc.min == min(window)
+        assert acc.max == max(window)
+        assert acc.avg == pytest.approx(sum(window) / len(window))
+
+    assert acc.sma == pytest.approx(sum(values[-4:]) / 4)
+    assert acc.count == len(values)
+    assert acc.total == sum(values)
+
+
+def test_profiler_set_window():
+    profiler = Profiler()
+    profiler.set_window('update', 2)
+    for value in (1, 2, 3):
+        profiler.accumulate('update', value)
+
+    stat = profiler['update']
+    assert (stat.avg, stat.min, stat.max, stat.latest) == (2.5, 2, 3, 3)
+
+    profiler.reset()
+    for value in (4, 5, 6):
+        profiler.accumulate('update', value)
+    assert profiler['update'].avg == 5.5
+
+
+def test_nested_scopes():
+    profiler = Profiler()
+    with profiler.profile('frame'):
+        with profiler.profile('update'):
+            sleep(0.01)
+        with profiler.profile('update'):
+            with profiler.profile('physics'):
+                sleep(0.01)
+        sleep(0.01)
+
+    frame = profiler.scopes['frame']
+    update = profiler.scopes['frame;update']
+    physics = profiler.scopes['frame;update;physics']
+
+    assert update.count == 2
+    assert physics.self_time == physics.total
+    assert update.self_time == pytest.approx(update.total - physics.total)
+    assert frame.self_time == pytest.approx(frame.total - update.total)
+    assert profiler['update'].latest < update.total
+
+
+def test_collapsed(tmp_path):
+    profiler = Profiler()
+    profiler.scopes['a'].self_time = 0.5
+    profiler.scopes['a;b'].self_time = 0.000002
+    profiler.scopes['a;c'].self_time = 0
+
+    assert profiler.collapsed() == ['a 500000', 'a;b 2']
+
+    path = tmp_path / 'stacks.txt'
+    profiler.write_collapsed(path)
+    assert path.read_text() == 'a 500000\na;b 2\n'
+
+
+def test_disabled_profiler():
+    profiler = Profiler()
+    profiler.enabled = False
+
+    with profiler.profile('update'):
+        pass
+
+    assert not profiler.data
+    assert not profiler.scopes
+
+
+def test_profiled_decorator():
+    profiler = Profiler()
+
+    @profiled(profiler=profiler)
+    def handler(x):
+        return 2 * x
+
+    assert handler(21) == 42
+    assert profiler.scopes['test_profiled_decorator.<locals>.handler'].count == 1
+
+    profiler.enabled = False
+    assert handler(1) == 2
+    assert profiler.scopes['test_profiled_decorator.<locals>.handler'].count == 1
+
+
+def test_profiled_class_hook():
+    class Base(Profiled):
+        profiled_methods = ('update', )
+
+        def update(self):
+            return 'base'
+
+    class Child(Base):
+        def update(self):
+            return super().update()
+
+    global_profiler.reset()
+    assert Child().update() == 'base'
+    assert global_profiler.scopes['Child;Base'].count == 1
+    assert global_profiler.scopes['Child'].count == 1
+
+
+def test_trace(tmp_path):
+    profiler = Profiler()
+    with profiler.profile('before'):
+        pass
+
+    profiler.start_trace()
+    for _ in range(3):
+        with profiler.profile('frame'):
+            with profiler.profile('update'):
+                pass
+    trace = profiler.stop_trace()
+
+    with profiler.profile('after'):
+        pass
+
+    assert [stat for stat, *_ in trace] == ['update', 'frame'] * 3
+
+    path = tmp_path / 'trace.json'
+    profiler.write_trace(path, trace)
+    events = json.loads(path.read_text())['traceEvents']
+    assert len(events) == 6
+    assert min(e['ts'] for e in events) == 0
+    update, frame = events[:2]
+    assert frame['ph'] == 'X'
+    assert frame['ts'] <= update['ts']
+    assert update['ts'] + update['dur'] <= frame['ts'] + frame['dur']
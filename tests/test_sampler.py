@@ -0,0 +1,42 @@
+from time import perf_counter
+from types import SimpleNamespace
+
+from ddframework.sampler import Sampler
+
+
+class Busy:
+    pass
+
+
+def spin(seconds):
+    end = perf_counter() + seconds
+    while perf_counter() < end:
+        pass
+
+
+def test_sampler_attribution():
+    app = SimpleNamespace(state_stack=[SimpleNamespace(state=Busy())], stage='update')
+
+    with Sampler(app, interval=0.001) as sampler:
+        spin(0.2)
+
+    assert sampler.samples[('Busy', 'update')] > 10
+
+    function, count, fraction = sampler.table('Busy', 'update', top=1)[0]
+    assert function.startswith('spin ')
+    assert fraction > 0.5
+
+    # All frames below spin have the same cumulative count, so look the
+    # test itself up directly instead of relying on the top n order.
+    code = test_sampler_attribution.__code__
+    assert sampler.cumulative[('Busy', 'update')][code] == sampler.samples[('Busy', 'update')]
+
+
+def test_sampler_empty_stack():
+    app = SimpleNamespace(state_stack=[], stage=None)
+    sampler = Sampler(app)
+    sampler.start()
+    sampler.sample()
+    sampler.stop()
+
+    assert sampler.samples[(None, None)] >= 1
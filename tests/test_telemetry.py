@@ -0,0 +1,55 @@
+import io
+import json
+import math
+
+from ddframework.profiler import Profiler
+from ddframework.telemetry import TelemetrySink
+
+
+def fill(sink, frames):
+    profiler = Profiler()
+    for i in range(frames):
+        profiler.accumulate('update', i)
+        profiler.accumulate('draw', 2 * i)
+        sink.record(profiler)
+
+
+def test_csv_bulk_flush():
+    out = io.StringIO()
+    sink = TelemetrySink(out, keys=('update', 'draw'), capacity=4)
+
+    fill(sink, 3)
+    assert out.getvalue() == 'frame,time,update,draw\r\n'
+
+    fill(sink, 1)
+    lines = out.getvalue().splitlines()
+    assert len(lines) == 5
+    assert lines[2].startswith('1,')
+    assert lines[2].endswith(',1.0,2.0')
+
+
+def test_jsonl_close(tmp_path):
+    path = tmp_path / 'trace.jsonl'
+    with TelemetrySink(path, keys=('update', 'draw'), capacity=100) as sink:
+        fill(sink, 5)
+
+    rows = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [row['frame'] for row in rows] == [0, 1, 2, 3, 4]
+    assert rows[-1]['update'] == 4
+    assert rows[-1]['draw'] == 8
+
+
+def test_idle_frames_are_nan(tmp_path):
+    path = tmp_path / 'trace.jsonl'
+    profiler = Profiler()
+    with TelemetrySink(path, keys=('update', 'draw'), capacity=100) as sink:
+        profiler.accumulate('update', 1)
+        profiler.accumulate('draw', 2)
+        sink.record(profiler)
+        profiler.accumulate('update', 3)
+        sink.record(profiler)
+
+        assert math.isnan(list(sink.rows())[1][3])
+
+    rows = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [(row['update'], row['draw']) for row in rows] == [(1, 2), (3, None)]
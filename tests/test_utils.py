@@ -0,0 +1,25 @@
+import pytest
+
+from ddframework.utils import accessor, compile_path, xpath
+
+
+def test_compile_path_is_interned():
+    keys = compile_path('a.b.c')
+    assert keys == ('a', 'b', 'c')
+    assert compile_path('a.b.c') is keys
+
+
+def test_xpath():
+    d = {'a': {'b': {'c': 1}}}
+    assert xpath(d, 'a.b.c') == 1
+    assert xpath(d, 'a.x', early=True) == {'b': {'c': 1}}
+
+    with pytest.raises(KeyError):
+        xpath(d, 'a.x')
+
+
+def test_accessor():
+    d = {'a': {'b': 2}, 'c': 3}
+    assert accessor('a.b')(d) == 2
+    assert accessor('c')(d) == 3
+    assert accessor('a.b.c', early=True)(d) == 2